@@ -0,0 +1,90 @@
+"""Throughput of concurrent ``ctx.get`` calls against a local stand-in server.
+
+Runs the same workload twice: once with every request funneled through a single
+lock (how ``EasyRequests`` used to behave) and once with the current concurrent,
+coalescing implementation.
+
+    python -m benchmarks.ezrequests_concurrency -n 200 --delay 50 --distinct 20
+"""
+import argparse
+import asyncio
+import time
+import types
+
+from aiohttp import web
+
+from utils.config import Config
+from utils.ezrequests import EasyRequests
+
+
+class FakeContext:
+    def __init__(self, ezr):
+        self.ezr = ezr
+
+    async def get(self, *args, **kwargs):
+        return await self.ezr.request("GET", *args, **kwargs)
+
+
+class SerializedContext(FakeContext):
+    def __init__(self, ezr):
+        super().__init__(ezr)
+        self.lock = asyncio.Lock()
+
+    async def get(self, *args, **kwargs):
+        async with self.lock:
+            return await super().get(*args, **kwargs)
+
+
+async def start_server(delay):
+    hits = 0
+
+    async def handler(request):
+        nonlocal hits
+        hits += 1
+        await asyncio.sleep(delay / 1000)
+        return web.json_response({"q": request.query.get("q")})
+
+    app = web.Application()
+    app.router.add_get("/", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/", lambda: hits
+
+
+async def run(ctx, url, n, distinct):
+    start = time.perf_counter()
+    await asyncio.gather(*[ctx.get(url, q=str(i % distinct)) for i in range(n)])
+    return time.perf_counter() - start
+
+
+async def main(args):
+    loop = asyncio.get_event_loop()
+    runner, url, hits = await start_server(args.delay)
+
+    # the local server doesn't need to be protected from bursts
+    config = Config.from_dict({"http": {"ratelimits": {"default": {"rate": args.n, "per": 1}}}})
+    bot = types.SimpleNamespace(loop=loop, http_headers={"User-Agent": "Python/aiohttp"}, config=config)
+    ezr = await EasyRequests.start(bot)
+
+    try:
+        for name, cls in (("serialized (before)", SerializedContext), ("concurrent (after)", FakeContext)):
+            before = hits()
+            elapsed = await run(cls(ezr), url, args.n, args.distinct)
+            print(f"{name:<20} {args.n} requests in {elapsed:.3f}s -> {args.n / elapsed:>8.1f} req/s, "
+                  f"{hits() - before} reached the server")
+    finally:
+        await ezr.close()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=200, help="concurrent ctx.get calls")
+    parser.add_argument("--delay", type=float, default=50, help="server response delay in ms")
+    parser.add_argument("--distinct", type=int, default=20, help="distinct URLs among the N calls")
+
+    asyncio.get_event_loop().run_until_complete(main(parser.parse_args()))
@@ -0,0 +1,95 @@
+"""Event loop lag under heavy logging, with a plain ``FileHandler`` vs the queue based pipeline.
+
+A task logs ``--burst`` records every millisecond while a ticker measures how late 1ms sleeps wake up.
+``--write-delay`` makes every flush take that long, to simulate a slow or busy disk.
+
+    python -m benchmarks.logging_lag --seconds 3 --burst 50
+    python -m benchmarks.logging_lag --write-delay 0.5
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+from utils import logs
+
+
+async def ticker(lags, stop):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append((time.perf_counter() - start - 0.001) * 1000)
+
+
+async def spam(log, burst, seconds):
+    end = time.perf_counter() + seconds
+    count = 0
+
+    while time.perf_counter() < end:
+        for _ in range(burst):
+            log.debug("200 GET https://example.com/api/%s returned %s", count, "x" * 200)
+            count += 1
+
+        await asyncio.sleep(0.001)
+
+    return count
+
+
+async def measure(log, args):
+    lags = []
+    stop = asyncio.Event()
+    task = asyncio.ensure_future(ticker(lags, stop))
+
+    count = await spam(log, args.burst, args.seconds)
+    stop.set()
+    await task
+
+    lags.sort()
+    return count, lags[len(lags) // 2], lags[int(len(lags) * 0.99) - 1], lags[-1]
+
+
+def slow_flush(delay, flush=logging.StreamHandler.flush):
+    def wrapper(self):
+        time.sleep(delay / 1000)
+        flush(self)
+
+    return wrapper
+
+
+def main(args):
+    directory = tempfile.mkdtemp()
+
+    if args.write_delay:
+        logging.StreamHandler.flush = slow_flush(args.write_delay)
+
+    loop = asyncio.get_event_loop()
+
+    log = logging.getLogger("benchmarks.logging_lag")
+    log.setLevel(logging.DEBUG)
+    log.propagate = False
+
+    handler = logging.FileHandler(os.path.join(directory, "plain.log"), encoding="utf-8")
+    handler.setFormatter(logs.FORMAT)
+    log.handlers = [handler]
+    results = {"FileHandler": loop.run_until_complete(measure(log, args))}
+    handler.close()
+
+    listener = logs.setup_logging({"path": os.path.join(directory, "queued.log"), "console": False,
+                                   "levels": {log.name: "DEBUG"}})
+    results["QueueHandler"] = loop.run_until_complete(measure(log, args))
+    listener.stop()
+
+    for name, (count, p50, p99, worst) in results.items():
+        print(f"{name:>12}: {count / args.seconds:8.0f} records/s, loop lag p50 {p50:.2f}ms, "
+              f"p99 {p99:.2f}ms, max {worst:.2f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--burst", type=int, default=50)
+    parser.add_argument("--write-delay", type=float, default=0, help="Milliseconds every flush takes")
+
+    main(parser.parse_args())
@@ -0,0 +1,93 @@
+"""Event loop lag while decoding big JSON responses and parsing big HTML pages, inline vs offloaded.
+
+A ticker task sleeps for 1ms in a loop and records how late it wakes up, which is what delays heartbeats.
+``inline`` sets ``http.offload.threshold`` so high nothing is offloaded, ``offloaded`` uses the default.
+
+    python -m benchmarks.offload --rounds 10 --items 100000
+"""
+import argparse
+import asyncio
+import time
+import types
+
+from aiohttp import web
+
+from utils.config import Config
+from utils.ezrequests import EasyRequests
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+
+async def start_server(items):
+    payload = json.dumps([{"id": i, "name": f"item {i}", "tags": ["a", "b", "c"]} for i in range(items)])
+    page = "<html><body>{0}</body></html>".format(
+        "".join(f"<div class='caption'><a class='cover' href='/g/{i}/'><img src='/{i}.jpg'/></a></div>"
+                for i in range(items)))
+
+    async def json_handler(_):
+        return web.Response(text=payload, content_type="application/json")
+
+    async def html_handler(_):
+        return web.Response(text=page, content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/json", json_handler)
+    app.router.add_get("/html", html_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "localhost", 0)
+    await site.start()
+
+    port = site._server.sockets[0].getsockname()[1]
+    print(f"JSON body: {len(payload) // 1024}KiB, HTML page: {len(page) // 1024}KiB")
+    return runner, f"http://localhost:{port}"
+
+
+async def ticker(lags, stop):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append((time.perf_counter() - start - 0.001) * 1000)
+
+
+async def measure(url, threshold, rounds):
+    config = Config.from_dict({"http": {"offload": {"threshold": threshold}}})
+    bot = types.SimpleNamespace(loop=asyncio.get_event_loop(), http_headers={}, config=config)
+    ezr = await EasyRequests.start(bot)
+    lags = []
+    stop = asyncio.Event()
+    task = bot.loop.create_task(ticker(lags, stop))
+
+    try:
+        for _ in range(rounds):
+            await ezr.request("GET", f"{url}/json")
+            await ezr.parse_html(await ezr.request("GET", f"{url}/html"))
+    finally:
+        stop.set()
+        await task
+        await ezr.close()
+
+    lags.sort()
+    return lags[len(lags) // 2], lags[int(len(lags) * 0.99) - 1], lags[-1]
+
+
+async def main(args):
+    runner, url = await start_server(args.items)
+
+    try:
+        for name, threshold in (("inline", float("inf")), ("offloaded", 64 * 1024)):
+            p50, p99, worst = await measure(url, threshold, args.rounds)
+            print(f"{name:>9}: loop lag p50 {p50:.2f}ms, p99 {p99:.2f}ms, max {worst:.2f}ms")
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--items", type=int, default=100000)
+
+    asyncio.get_event_loop().run_until_complete(main(parser.parse_args()))
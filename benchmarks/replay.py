@@ -0,0 +1,196 @@
+"""Throughput, latency and CPU time per command, replaying recorded HTTP responses.
+
+Runs the ``reddit``, ``anime``, ``pixiv`` and ``rtfm`` commands' own code, with a stand-in context,
+on top of ``EasyRequests`` in replay mode, so nothing touches the network. Without ``--fixture``
+a synthetic fixture is generated, to replay real responses record them first by running the bot with
+``http.replay.mode`` set to ``"record"``. The response cache (and the reddit cog's post cache) is off
+unless ``--cache`` is passed, so every command makes its requests.
+
+Run it from the repository root, the cogs read files relative to it.
+
+    python -m benchmarks.replay --requests 5000 --concurrency 50
+    python -m benchmarks.replay --fixture fixtures/http.json --cache
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+import types
+import zlib
+
+from cogs.dev import DevUtils, SphinxObjectFileReader
+from cogs.nsfw import NSFW
+from cogs.reddit import Reddit
+from cogs.weeb import Weeb
+from utils.config import Config
+from utils.context import RightSiderContext
+from utils.ezrequests import EasyRequests
+from utils.replay import Recording, fixture_key
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+NAMES = [f"name{i}" for i in range(50)]
+JSON = [("Content-Type", "application/json")]
+
+REDDIT = "https://www.reddit.com/r/{0}/hot.json"
+ANILIST = "https://graphql.anilist.co"
+PIXIV_SEARCH = "https://app-api.pixiv.net/v1/search/illust"
+PIXIV = "https://i.pximg.net/img-original/img/{0}.png"
+RTFM = "https://{0}.readthedocs.io/en/latest"
+
+
+class BenchContext:
+    """Just enough of a command context for the commands to run, requests go through the real helpers."""
+
+    _request = RightSiderContext._request
+    get = RightSiderContext.get
+    post = RightSiderContext.post
+    stream = RightSiderContext.stream
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.guild = None
+        self.channel = types.SimpleNamespace(is_nsfw=lambda: True)
+
+    async def send(self, *args, file=None, **kwargs):
+        if file is not None:
+            file.close()
+
+    async def trigger_typing(self):
+        pass
+
+
+class NoCache(dict):
+    """Never keeps anything, so the reddit cog fetches posts every time."""
+
+    def __setitem__(self, key, value):
+        pass
+
+
+def anilist_body(cogs, name):
+    return {"query": cogs["weeb"].anilist_queries["media"].format(type="ANIME"), "variables": {"search": name}}
+
+
+def build_fixture(path, cogs):
+    recording = Recording(path)
+
+    for name in NAMES:
+        posts = [{"data": {"title": f"{name} {i}", "subreddit_name_prefixed": f"r/{name}", "thumbnail": "default",
+                           "created_utc": 1500000000 + i, "permalink": f"/r/{name}/comments/{i}/",
+                           "author_flair_text": None, "selftext": "", "num_crossposts": 0, "num_comments": i,
+                           "link_flair_type": "text", "url": f"https://i.redd.it/{i}.png", "over_18": False,
+                           "is_video": False, "secure_media": None}}
+                 for i in range(20)]
+        recording.add(fixture_key("GET", REDDIT.format(name), {"limit": 20}), "GET", REDDIT.format(name), 200, JSON,
+                      json.dumps({"data": {"children": posts}}).encode())
+
+        media = {"data": {"Media": {"id": 1, "title": {"romaji": name}, "description": "x<br>" * 400, "episodes": 12,
+                                    "season": "SPRING", "meanScore": 75, "isAdult": False, "siteUrl": ANILIST,
+                                    "bannerImage": None, "chapters": None, "volumes": None, "duration": 24,
+                                    "endDate": {"year": 2019, "month": 6, "day": 30},
+                                    "startDate": {"year": 2019, "month": 4, "day": 1},
+                                    "coverImage": {"extraLarge": PIXIV.format(name), "color": "#e4a15d"}}}}
+        recording.add(fixture_key("POST", ANILIST, json_body=anilist_body(cogs, name)), "POST", ANILIST, 200, JSON,
+                      json.dumps(media).encode())
+
+        params = {"word": name, "search_target": "partial_match_for_tags"}
+        illusts = [{"id": i, "title": f"{name} {i}", "create_date": "2019-01-01T00:00:00+09:00",
+                    "user": {"id": i, "name": name}, "caption": "a<br />b", "tags": [{"name": name}],
+                    "total_view": i, "total_bookmarks": i, "meta_pages": [],
+                    "meta_single_page": {"original_image_url": PIXIV.format(name)}}
+                   for i in range(10)]
+        recording.add(fixture_key("GET", PIXIV_SEARCH, params), "GET", PIXIV_SEARCH, 200, JSON,
+                      json.dumps({"illusts": illusts}).encode())
+        recording.add(fixture_key("GET", PIXIV.format(name)), "GET", PIXIV.format(name), 200,
+                      [("Content-Type", "image/png")], os.urandom(256 * 1024))
+
+        inventory = "\n".join(f"{name}.obj{i} py:function 1 api.html#$ -" for i in range(2000))
+        header = b"# Sphinx inventory version 2\n# Project: x\n# Version: 1\n# zlib\n"
+        url = RTFM.format(name) + "/objects.inv"
+        recording.add(fixture_key("GET", url), "GET", url, 200, [("Content-Type", "application/octet-stream")],
+                      header + zlib.compress(inventory.encode()))
+
+    recording.save()
+
+
+async def reddit(cogs, ctx, name):
+    await cogs["reddit"].do_post(ctx, f"/r/{name}/hot.json", limit=20)
+
+
+async def anime(cogs, ctx, name):
+    await cogs["weeb"].anime.callback(cogs["weeb"], ctx, name=name)
+
+
+async def pixiv(cogs, ctx, name):
+    await cogs["nsfw"].pixiv.callback(cogs["nsfw"], ctx, query=name)
+
+
+async def rtfm(cogs, ctx, name):
+    # what DevUtils.build_rtfm_lookup_table and do_rtfm do for a single page
+    dev = cogs["dev"]
+    page = RTFM.format(name)
+    out = await ctx.bot.ezr.request("GET", page + "/objects.inv", priority="background")
+    table = dev.parse_object_inv(SphinxObjectFileReader(out), page)
+    dev.finder("obj1", list(table.items()), key=lambda t: t[0], lazy=False)[:12]
+
+
+async def run(cogs, ctx, command, requests, concurrency):
+    timings = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def invoke(i):
+        async with semaphore:
+            start = time.perf_counter()
+            await command(cogs, ctx, NAMES[i % len(NAMES)])
+            timings.append((time.perf_counter() - start) * 1000)
+
+    cpu, wall = time.process_time(), time.perf_counter()
+    await asyncio.gather(*[invoke(i) for i in range(requests)])
+    cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+
+    timings.sort()
+    print(f"{command.__name__:>6}: {requests / wall:8.0f} cmd/s, p50 {statistics.median(timings):.3f}ms, "
+          f"p99 {timings[int(len(timings) * 0.99) - 1]:.3f}ms, {cpu / requests * 1e6:.1f}us CPU per command")
+
+
+async def main(args):
+    http = {"replay": {"mode": "replay", "path": None}, "ratelimits": {"default": {"rate": 10 ** 9, "per": 1}}}
+    if not args.cache:
+        http["cache"] = {"max_bytes": 0, "negative": {"max_bytes": 0}}
+
+    config = Config.from_dict({"http": http})
+    bot = types.SimpleNamespace(loop=asyncio.get_event_loop(), http_headers={}, config=config)
+    cogs = {"reddit": Reddit(bot), "weeb": Weeb(bot), "nsfw": NSFW(bot), "dev": DevUtils(bot)}
+    cogs["nsfw"].token = "Bearer bench"
+    if not args.cache:
+        cogs["reddit"]._post_cache = NoCache()
+
+    path = args.fixture
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(), "http.json")
+        build_fixture(path, cogs)
+
+    config["http"]["replay"]["path"] = path
+    bot.ezr = await EasyRequests.start(bot)
+    ctx = BenchContext(bot)
+
+    try:
+        for command in (reddit, anime, pixiv, rtfm):
+            await run(cogs, ctx, command, args.requests, args.concurrency)
+    finally:
+        await bot.ezr.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fixture", default=None, help="Recorded fixture file, a synthetic one is used by default")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--cache", action="store_true", help="Keep the response cache on, like the bot does")
+
+    asyncio.get_event_loop().run_until_complete(main(parser.parse_args()))
@@ -0,0 +1,80 @@
+"""Creating and deleting ``-n`` timers one by one vs with :meth:`TimerManager.create_timers`/``delete_timers``.
+
+Needs a running Redis, the timers go under a ``bench:`` prefix so a real bot's timers aren't touched.
+Point ``--redis`` at a remote server to see the effect of round trip latency.
+
+    python -m benchmarks.timers_batch -n 500
+    python -m benchmarks.timers_batch -n 500 --redis redis://10.0.0.2:6379/1
+"""
+import argparse
+import asyncio
+import time
+import types
+
+import aioredis
+
+from utils.timers import TimerManager
+
+
+class BenchTimerManager(TimerManager):
+    DUE_KEY = "bench:timers:due"
+    DATA_KEY = "bench:timers:data"
+    INDEX_PREFIX = "bench:timers:index:"
+
+
+def mutes(n):
+    return [("mute", 3600, {"guild_id": 1, "member_id": member_id, "role_id": 2}) for member_id in range(n)]
+
+
+async def single(timers, batch):
+    start = time.perf_counter()
+    for name, seconds, kwargs in batch:
+        await timers.create_timer(name, seconds, **kwargs)
+    created = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for name, _, kwargs in batch:
+        await timers.delete_timer(name, **kwargs)
+
+    return created, time.perf_counter() - start
+
+
+async def batched(timers, batch):
+    start = time.perf_counter()
+    await timers.create_timers(batch)
+    created = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await timers.delete_timers([(name, kwargs) for name, _, kwargs in batch])
+
+    return created, time.perf_counter() - start
+
+
+async def main(args):
+    redis = await aioredis.create_redis_pool(args.redis, encoding="utf-8")
+    # never ready, so the manager doesn't dispatch anything on its own
+    bot = types.SimpleNamespace(loop=asyncio.get_event_loop(), redis=redis, wait_until_ready=asyncio.Event().wait,
+                                dispatch=lambda *_: None)
+    timers = BenchTimerManager(bot)
+
+    batch = mutes(args.n)
+
+    try:
+        for name, func in (("single", single), ("batched", batched)):
+            created, deleted = await func(timers, batch)
+            assert await redis.zcard(timers.DUE_KEY) == 0
+
+            print(f"{name:>8}: create {created * 1000:8.2f}ms ({args.n / created:8.0f} timers/s), "
+                  f"delete {deleted * 1000:8.2f}ms ({args.n / deleted:8.0f} timers/s)")
+    finally:
+        timers.close()
+        redis.close()
+        await redis.wait_closed()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=500)
+    parser.add_argument("--redis", default="redis://localhost:6379")
+
+    asyncio.get_event_loop().run_until_complete(main(parser.parse_args()))
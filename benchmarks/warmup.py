@@ -0,0 +1,79 @@
+"""Cold vs warm first-request latency of a fresh ``EasyRequests``.
+
+Every round builds a new ``EasyRequests`` (so a new connection pool and DNS cache),
+optionally runs :meth:`EasyRequests.warmup` and then times the first request.
+Point ``--url`` at a real API to include TLS, by default a local server is used.
+
+    python -m benchmarks.warmup --rounds 20
+    python -m benchmarks.warmup --url https://graphql.anilist.co/
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import types
+
+from aiohttp import web
+
+from utils.config import Config
+from utils.ezrequests import EasyRequests
+
+
+async def start_server():
+    async def handler(_):
+        return web.json_response({})
+
+    app = web.Application()
+    app.router.add_route("*", "/", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "localhost", 0)
+    await site.start()
+
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://localhost:{port}/"
+
+
+async def first_request(url, warm):
+    config = Config.from_dict({"http": {"warmup": {"hosts": [url]},
+                                        "ratelimits": {"default": {"rate": 1000, "per": 1}}}})
+    bot = types.SimpleNamespace(loop=asyncio.get_event_loop(), http_headers={"User-Agent": "Python/aiohttp"},
+                                config=config)
+    ezr = await EasyRequests.start(bot)
+
+    try:
+        if warm:
+            await ezr.warmup()
+
+        start = time.perf_counter()
+        try:
+            await ezr.request("GET", url)
+        except Exception:
+            pass  # only the round trip matters
+        return (time.perf_counter() - start) * 1000
+    finally:
+        await ezr.close()
+
+
+async def main(args):
+    runner = None
+    url = args.url
+    if url is None:
+        runner, url = await start_server()
+
+    try:
+        for name, warm in (("cold", False), ("warm", True)):
+            timings = [await first_request(url, warm) for _ in range(args.rounds)]
+            print(f"{name}: first request median {statistics.median(timings):.2f}ms, "
+                  f"max {max(timings):.2f}ms over {args.rounds} rounds")
+    finally:
+        if runner is not None:
+            await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=None, help="URL to request, defaults to a local server")
+    parser.add_argument("--rounds", type=int, default=20)
+
+    asyncio.get_event_loop().run_until_complete(main(parser.parse_args()))
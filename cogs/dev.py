@@ -10,11 +10,11 @@ from urllib.parse import quote as urlquote
 
 import discord
 from discord.ext import commands
-from lxml import etree
 
 from utils import trunc_text
 from utils.checks import requires_config
 from utils.converters import Codeblock
+from utils.ezrequests import stop_after
 from utils.tio import Tio
 
 try:
@@ -160,7 +160,7 @@ class DevUtils(commands.Cog, name="Dev Utils",
                 continue
             cache[key] = {}
 
-            out = await self.bot.ezr.request("GET", page + "/objects.inv")
+            out = await self.bot.ezr.request("GET", page + "/objects.inv", priority="background")
 
             stream = SphinxObjectFileReader(out)
             cache[key] = self.parse_object_inv(stream, page)
@@ -238,11 +238,12 @@ class DevUtils(commands.Cog, name="Dev Utils",
     async def http_status(self, ctx, *, code):
         """Get basic info about an HTTP status code."""
         try:
-            html = await ctx.get("https://httpstatuses.com/{0}".format(urlquote(code)), cache=True)
+            nodes = await ctx.scrape("https://httpstatuses.com/{0}".format(urlquote(code)),
+                                     until=stop_after("p", 2), cache=True)
         except Exception:
             return await ctx.send("404")
-
-        nodes = etree.fromstring(html, etree.HTMLParser())
+        if nodes is None:
+            return await ctx.send("404")
         embed = discord.Embed(
             title=nodes.xpath("string((//h1)[1])").strip(),
             color=discord.Color(0x008CFF)
@@ -5,7 +5,7 @@ import sentry_sdk
 from discord.ext import commands
 
 from utils.emotes import ARI_DERP, YAM_SAD
-from utils.ezrequests import WebException
+from utils.ezrequests import CircuitOpen, PayloadTooLarge, RateLimited, WebException
 from utils.formats import PaginationError
 
 
@@ -54,6 +54,18 @@ class CommandHandler(commands.Cog):
             except discord.HTTPException:
                 pass
 
+        elif isinstance(exc, PayloadTooLarge):
+            await ctx.add_reaction(YAM_SAD)
+            await ctx.send("The file is too big to be uploaded here.")
+
+        elif isinstance(exc, RateLimited):
+            await ctx.add_reaction(YAM_SAD)
+            await ctx.send(f"Too many requests to `{exc.host}`, retry in **{exc.retry_after:.2f}** seconds.")
+
+        elif isinstance(exc, CircuitOpen):
+            await ctx.add_reaction(YAM_SAD)
+            await ctx.send(f"`{exc.host}` is currently not responding, retry in **{exc.retry_after:.2f}** seconds.")
+
         elif isinstance(exc, WebException):
             await ctx.add_reaction(YAM_SAD)
             await ctx.send("Not found or API did not respond.")
@@ -331,9 +331,9 @@ class General(commands.Cog, command_attrs=dict(cooldown=commands.Cooldown(1, 2.5
             await ctx.send(file=discord.File(fp, filename=f"{emoji.name}{'.png' if not emoji.animated else '.gif'}"))
         else:
             fmt_name = "-".join(f"{ord(c):x}" for c in emoji)
-            r = await ctx.get(f"http://twemoji.maxcdn.com/2/72x72/{fmt_name}.png")
+            fp = await ctx.stream(f"http://twemoji.maxcdn.com/2/72x72/{fmt_name}.png")
 
-            await ctx.send(file=discord.File(io.BytesIO(r), filename=f"{fmt_name}.png"))
+            await ctx.send(file=discord.File(fp, filename=f"{fmt_name}.png"))
 
     @commands.command(name="say", aliases=["echo"])
     async def say(self, ctx, *, arg: commands.clean_content):
@@ -381,7 +381,7 @@ class General(commands.Cog, command_attrs=dict(cooldown=commands.Cooldown(1, 2.5
     @commands.command(name="amiibo")
     async def amiibo(self, ctx, *, name: commands.clean_content):
         """Get info about an amiibo."""
-        amiibo = await ctx.get("https://www.amiiboapi.com/api/amiibo", cache=True, name=name)
+        amiibo = await ctx.get("https://www.amiiboapi.com/api/amiibo", cache="swr", negative=True, name=name)
 
         for data in amiibo["amiibo"]:
             embed = self.build_amiibo_embed(data)
@@ -245,6 +245,48 @@ class Moderator(commands.Cog, command_attrs=dict(cooldown=commands.Cooldown(5, 2
             nat = "a long time"
         await ctx.send(f"Muted {member} ({reason}), will be unmuted in {nat}.")
 
+    @commands.command(name="mass-tempmute", aliases=["masstempmute"])
+    @utils.bot_and_author_have_permissions(manage_roles=True)
+    async def mass_tempmute(self, ctx, time: utils.ShortTime(arg_required=False, past_ok=False),
+                            members: commands.Greedy[discord.Member], *,
+                            reason: commands.clean_content = "No reason"):
+        """Mute temporarly several members at once.
+
+        The date must be in a format like '1h30m'."""
+        if not members:
+            raise commands.BadArgument("No members to mute.")
+
+        role = await self.get_mute_role(ctx)
+
+        delta = (time.date - ctx.message.created_at).total_seconds()
+        if delta < 1:
+            raise commands.BadArgument("Invalid time")
+
+        members = set(members)
+        muted = []
+        for member in members:
+            try:
+                await member.add_roles(role, reason=reason)
+            except discord.HTTPException:
+                continue
+
+            muted.append(member)
+
+        await self.bot.timers.create_timers([
+            ("mute", delta, {"guild_id": ctx.guild.id, "member_id": member.id, "role_id": role.id}) for member in muted
+        ])
+
+        try:
+            nat = naturaldelta(delta)
+        except OverflowError:
+            nat = "a long time"
+
+        msg = f"Muted {len(muted)} members ({reason}), they will be unmuted in {nat}."
+        if len(muted) != len(members):
+            msg += f" Failed to give the Mute role to {len(members) - len(muted)} members."
+
+        await ctx.send(msg)
+
     @commands.command(name="unmute")
     @utils.bot_and_author_have_permissions(manage_roles=True)
     async def unmute(self, ctx, member: discord.Member, *, reason: commands.clean_content = "No reason"):
@@ -273,17 +315,10 @@ class Moderator(commands.Cog, command_attrs=dict(cooldown=commands.Cooldown(5, 2
     @commands.command(name="mutes")
     async def mutes(self, ctx):
         """List all the mutes active in this guild."""
-        redis = ctx.bot.redis
         d = []
 
-        async for key in redis.iscan(match="timer-mute:*"):
-            data = await redis.hmget(key, "guild_id", "member_id")
-            if not int(data[0]) == ctx.guild.id:
-                continue
-
-            ttl = await redis.ttl(key)
-
-            d.append({"member_id": int(data[1]), "ttl": ttl})
+        for kwargs, remaining in await ctx.bot.timers.list_timers("mute", ctx.guild.id):
+            d.append({"member_id": int(kwargs["member_id"]), "ttl": remaining})
 
         for l in utils.chunks(d, 10):
             embed = discord.Embed(title=f"Mutes for {ctx.guild}")
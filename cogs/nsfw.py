@@ -1,4 +1,3 @@
-import io
 import logging
 import random
 import typing
@@ -7,10 +6,10 @@ from html import unescape as htmlunescape
 
 import aiohttp
 import discord
-import lxml.etree as etree
 from discord.ext import commands, flags, tasks
 
 import utils
+from utils.ezrequests import stop_after
 
 LOG = logging.getLogger("cogs.nsfw")
 
@@ -33,7 +32,7 @@ class NSFW(commands.Cog, command_attrs=dict(cooldown=commands.Cooldown(1, 2.5, c
     @tasks.loop(hours=1)
     async def pixiv_token(self):
         data = await self.bot.ezr.request(
-            "POST", "https://oauth.secure.pixiv.net/auth/token", __data=self.pixiv_data
+            "POST", "https://oauth.secure.pixiv.net/auth/token", __data=self.pixiv_data, priority="background"
         )
 
         auth = data["response"]["token_type"].capitalize() + " " + data["response"]["access_token"]
@@ -48,7 +47,7 @@ class NSFW(commands.Cog, command_attrs=dict(cooldown=commands.Cooldown(1, 2.5, c
             word=query,
             search_target="partial_match_for_tags",
             __headers={"Authorization": self.token},
-            cache=True,
+            cache="swr",
         )
 
         try:
@@ -77,9 +76,7 @@ class NSFW(commands.Cog, command_attrs=dict(cooldown=commands.Cooldown(1, 2.5, c
             url = result["meta_single_page"]["original_image_url"]
             embed.add_field(name="Type", value="Oneoff illustration")
 
-        image = await ctx.get(url, __headers={"Referer": "https://app-api.pixiv.net/"})
-        fp = io.BytesIO(image)
-        fp.seek(0)
+        fp = await ctx.stream(url, __headers={"Referer": "https://app-api.pixiv.net/"})
         embed.set_image(url="attachment://original.jpg")
 
         await ctx.send(embed=embed, file=discord.File(fp, "original.jpg"))
@@ -95,7 +92,7 @@ class NSFW(commands.Cog, command_attrs=dict(cooldown=commands.Cooldown(1, 2.5, c
 
     async def get_mrm_search(self, ctx, query: str):
         html = await ctx.get("https://myreadingmanga.info/search/", search=query, cache=True)
-        nodes = etree.fromstring(html, etree.HTMLParser())
+        nodes = await ctx.parse_html(html)
 
         titles = tuple(t.text for t in nodes.xpath(f"//a[starts-with(@href, '{self.mrm_url}')]")[6:-8])
         urls = tuple(url for url in nodes.xpath(f"//a[starts-with(@href, '{self.mrm_url}')]/@href")[6:-8])
@@ -134,14 +131,17 @@ class NSFW(commands.Cog, command_attrs=dict(cooldown=commands.Cooldown(1, 2.5, c
 
         You can provide a MRM url or a search term."""
         html = await ctx.get(search, cache=True)
-        nodes = etree.fromstring(html, etree.HTMLParser())
+        nodes = await ctx.parse_html(html)
         images = tuple(img for img in nodes.xpath("//img/@data-lazy-src"))
 
         await self.generate_reader_embed(ctx, images)
 
     async def get_nh_search(self, ctx, query: str):
-        html = await ctx.get("https://nhentai.net/search", q=query, cache=True)
-        nodes = etree.fromstring(html, etree.HTMLParser())
+        # a search page has 25 results at most
+        nodes = await ctx.scrape("https://nhentai.net/search", q=query, cache=True,
+                                 until=stop_after("div", 25, {"class": "caption"}))
+        if nodes is None:
+            return ()
 
         thumbs = tuple(img for img in nodes.xpath(f"//img[{self.xpath_ends_with('@src', '.jpg')}]/@src"))
         titles = tuple(div.text for div in nodes.xpath("//div[@class='caption']"))
@@ -166,8 +166,11 @@ class NSFW(commands.Cog, command_attrs=dict(cooldown=commands.Cooldown(1, 2.5, c
         await ctx.paginate()
 
     async def get_zerochan_search(self, ctx, query: str):
-        html = await ctx.get("https://www.zerochan.net/search", q=query, cache=True)
-        nodes = etree.fromstring(html, etree.HTMLParser())
+        # zerochan answers searches with an error status but a valid page
+        nodes = await ctx.scrape("https://www.zerochan.net/search", q=query, cache=True, allow_errors=True,
+                                 until=stop_after("ul", 1, {"id": "thumbs2"}))
+        if nodes is None:
+            return ()
 
         images = tuple(img.replace(".240.", ".full.") for img in nodes.xpath("//img[@alt]/@src")[0::2])
 
@@ -1,5 +1,11 @@
+import io
+from datetime import datetime
+
+import discord
+import humanize
 from discord.ext import commands
 
+import utils
 from utils.emotes import FESTIVE, KAZ_HAPPY
 
 
@@ -31,6 +37,182 @@ class Owner(commands.Cog):
             await ctx.bot.redis("SREM", f"blacklister_{thing}s", str(id_))
             await ctx.add_reaction(KAZ_HAPPY)
 
+    @commands.group(name="cache", hidden=True, invoke_without_command=True)
+    async def cache(self, ctx):
+        """Show the HTTP response cache stats."""
+        stats = ctx.bot.ezr.cache.stats()
+        lookups = stats["hits"] + stats["stale"] + stats["misses"]
+
+        await ctx.send(f"```\n{stats['entries']} entries ({stats['expired']} expired)\n"
+                       f"{humanize.naturalsize(stats['size'], binary=True)} used out of "
+                       f"{humanize.naturalsize(stats['max_bytes'], binary=True)}\n"
+                       f"{stats['hits']} hits, {stats['stale']} stale, {stats['misses']} misses "
+                       f"({stats['hits'] / (lookups or 1):.1%} hit ratio), {stats['evictions']} evictions"
+                       f"{self._fmt_l2_stats(ctx.bot.ezr.l2)}"
+                       f"{self._fmt_negative_stats(ctx.bot.ezr.negative)}```")
+
+    def _fmt_l2_stats(self, l2):
+        if l2 is None:
+            return ""
+
+        stats = l2.stats()
+        return (f"\nRedis: {stats['hits']} hits, {stats['misses']} misses, "
+                f"{stats['skipped']} entries too big or not serializable")
+
+    def _fmt_negative_stats(self, negative):
+        stats = negative.stats()
+
+        return (f"\nNegative: {stats['entries']} entries, "
+                f"{humanize.naturalsize(stats['size'], binary=True)} used, {stats['hits']} hits")
+
+    @cache.command(name="purge", hidden=True)
+    async def cache_purge(self, ctx, *, target=None):
+        """Purge the HTTP response cache.
+
+        ``target`` can be a host or an URL prefix, everything is purged if it's not passed.
+        Redis entries can only be purged all at once."""
+        ezr = ctx.bot.ezr
+
+        if target is None:
+            count, l2_count = await ezr.clear_cache()
+        elif target.startswith(("http://", "https://")):
+            count, l2_count = await ezr.clear_cache(prefix=target.strip("<>"))
+        else:
+            count, l2_count = await ezr.clear_cache(host=target)
+
+        msg = f"Purged {count} entries."
+        if l2_count is not None:
+            msg += f" Purged {l2_count} entries from Redis."
+        elif ezr.l2 is not None:
+            msg += " Redis entries were **not** purged, their keys are hashed, purge everything to clear them."
+
+        await ctx.send(msg)
+
+    @cache.command(name="resize", hidden=True)
+    async def cache_resize(self, ctx, max_bytes: int):
+        """Set the maximum size of the HTTP response cache, in bytes."""
+        ctx.bot.ezr.cache.resize(max_bytes)
+
+        await ctx.send(f"Cache size set to {humanize.naturalsize(max_bytes, binary=True)}.")
+
+    @commands.group(name="breakers", hidden=True, invoke_without_command=True)
+    async def breakers(self, ctx):
+        """Show the state of the per host HTTP circuit breakers."""
+        breakers = ctx.bot.ezr.breakers
+
+        if not breakers:
+            return await ctx.send("No requests made yet.")
+
+        table = utils.Tabulator()
+        table.set_columns(["Host", "State", "Failures", "Trips", "Retry after"])
+        table.add_rows([host, b.state, b.failures, b.trips, f"{b.retry_after:.2f}s"]
+                       for host, b in sorted(breakers.items()))
+
+        await ctx.send(f"```\n{table.render()}\n```")
+
+    @breakers.command(name="reset", hidden=True)
+    async def breakers_reset(self, ctx, host=None):
+        """Close a host's circuit breaker, or all of them."""
+        for name, breaker in ctx.bot.ezr.breakers.items():
+            if host is None or name == host:
+                breaker.reset()
+
+        await ctx.add_reaction(KAZ_HAPPY)
+
+    async def send_table(self, ctx, table, filename):
+        render = table.render()
+
+        if len(render) > 1990:
+            return await ctx.send(file=discord.File(io.BytesIO(render.encode()), filename))
+
+        await ctx.send(f"```\n{render}\n```")
+
+    @commands.group(name="stats", hidden=True, invoke_without_command=True)
+    async def stats(self, ctx):
+        """Internal stats."""
+        await ctx.send_help(ctx.command)
+
+    @stats.command(name="http", hidden=True)
+    async def stats_http(self, ctx, host=None):
+        """Latency, status codes and cache counters of outgoing HTTP requests.
+
+        Pass a host to see its routes."""
+        stats = ctx.bot.ezr.stats
+        nat = humanize.naturalsize
+
+        table = utils.Tabulator()
+
+        if host is None:
+            table.set_columns(["Host", "Requests", "p50", "p95", "p99", "Errors", "Received", "Hit/Miss/Coal",
+                               "Hedged/Won"])
+            for name, r in stats.hosts():
+                cache = "/".join(str(stats.cache[(name, e)]) for e in ("hit", "miss", "coalesced"))
+                hedges = "/".join(str(stats.cache[(name, e)]) for e in ("hedge_fired", "hedge_won"))
+
+                table.add_row([name, r.latency.count, f"{r.latency.quantile(0.5)}ms", f"{r.latency.quantile(0.95)}ms",
+                               f"{r.latency.quantile(0.99)}ms", r.errors, nat(r.bytes, binary=True), cache, hedges])
+        else:
+            if host not in stats.routes:
+                return await ctx.send("No requests made to that host.")
+
+            table.set_columns(["Route", "Requests", "p50", "p95", "p99", "Statuses", "Received"])
+            for route, r in sorted(stats.routes[host].items()):
+                statuses = ", ".join(f"{s}: {c}" for s, c in r.statuses.most_common(4))
+
+                table.add_row([route, r.latency.count, f"{r.latency.quantile(0.5)}ms", f"{r.latency.quantile(0.95)}ms",
+                               f"{r.latency.quantile(0.99)}ms", statuses, nat(r.bytes, binary=True)])
+
+        await self.send_table(ctx, table, "http_stats.txt")
+
+    @stats.command(name="loop", hidden=True)
+    async def stats_loop(self, ctx):
+        """Event loop lag and the last stalls, with what was running during them."""
+        monitor = ctx.bot.loop_lag
+        hist = monitor.histogram
+
+        lines = [f"Last {len(monitor.recent) * monitor.interval:.0f}s: p50 {monitor.quantile(0.5):.2f}ms, "
+                 f"p95 {monitor.quantile(0.95):.2f}ms, p99 {monitor.quantile(0.99):.2f}ms, "
+                 f"max {max(monitor.recent, default=0):.2f}ms",
+                 f"Since start: {hist.count} samples, p99 under {hist.quantile(0.99)}ms, "
+                 f"{len(monitor.stalls)} stalls over {monitor.threshold}s kept"]
+
+        for stall in reversed(monitor.stalls):
+            duration = "ongoing" if stall.duration is None else f"{stall.duration:.3f}s"
+            lines.append(f"\n{utils.fmt_delta(datetime.utcfromtimestamp(stall.started_at))}, {duration}, "
+                         f"while running {stall.task}")
+            lines.append("".join(stall.stack[-6:]).rstrip())
+
+        text = "\n".join(lines)
+        if len(text) > 1990:
+            return await ctx.send(file=discord.File(io.BytesIO(text.encode()), "loop_stats.txt"))
+
+        await ctx.send(f"```\n{text}\n```")
+
+    @stats.command(name="timers", hidden=True)
+    async def stats_timers(self, ctx):
+        """How late timers were dispatched, per name."""
+        timers = ctx.bot.timers
+        stats = timers.stats()
+        pending = await ctx.bot.redis.zcard(timers.DUE_KEY)
+
+        table = utils.Tabulator()
+        table.set_columns(["Name", "Dispatched", "p50", "p95", "p99", "Max", "p99 since start"])
+        for name, lag in sorted(timers.lag.items()):
+            table.add_row([name, lag.histogram.count, f"{lag.quantile(0.5):.0f}ms", f"{lag.quantile(0.95):.0f}ms",
+                           f"{lag.quantile(0.99):.0f}ms", f"{lag.max:.0f}ms",
+                           f"under {lag.histogram.quantile(0.99)}ms"])
+
+        await ctx.send(f"{pending} pending, {stats['scheduled']} in memory, "
+                       f"{stats['queued']} waiting for one of {stats['workers']} workers")
+        await self.send_table(ctx, table, "timer_stats.txt")
+
+    @stats.command(name="prometheus", hidden=True)
+    async def stats_prometheus(self, ctx):
+        """Dump the HTTP stats in Prometheus' text format."""
+        dump = ctx.bot.ezr.stats.to_prometheus()
+
+        await ctx.send(file=discord.File(io.BytesIO(dump.encode()), "metrics.txt"))
+
 
 def setup(bot):
     bot.add_cog(Owner())
@@ -122,7 +122,8 @@ class Reddit(commands.Cog, command_attrs=dict(cooldown=commands.Cooldown(1, 2.5,
         except (KeyError, IndexError):
             pass
 
-        data = await ctx.get(self.BASE + path, **params, __headers=self.headers)
+        data = await ctx.get(self.BASE + path, **params, __headers=self.headers,
+                             negative=lambda d: not d["data"]["children"])
         results = data["data"]["children"]
 
         if not results:
@@ -0,0 +1,234 @@
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+import discord
+from discord.ext import commands, tasks
+from humanize import naturaldelta
+
+import utils
+
+LOG = logging.getLogger("cogs.reminders")
+
+# reminders due within this are kept in the timing wheel, the rest only in Postgres
+HORIZON = timedelta(hours=1)
+MIN_INTERVAL = timedelta(minutes=10)
+
+
+def to_timestamp(date):
+    return date.replace(tzinfo=timezone.utc).timestamp()
+
+
+class Reminders(commands.Cog, command_attrs=dict(cooldown=commands.Cooldown(1, 2.5, commands.BucketType.user))):
+    """Reminders, once or every so often."""
+
+    def __init__(self, bot):
+        self.bot = bot
+
+        self.wheel = utils.TimingWheel(now=time.time())
+        # {id: record}, what's in the wheel
+        self.pending = {}
+
+        self.tick.start()
+        self.refill.start()
+
+    def cog_unload(self):
+        self.tick.cancel()
+        self.refill.cancel()
+
+    def schedule(self, record):
+        if record["due_at"] - datetime.utcnow() >= HORIZON:
+            return
+
+        self.pending[record["id"]] = record
+        self.wheel.add(record["id"], to_timestamp(record["due_at"]))
+
+    def unschedule(self, id_):
+        self.pending.pop(id_, None)
+        self.wheel.remove(id_)
+
+    @tasks.loop(seconds=1)
+    async def tick(self):
+        for id_ in self.wheel.advance(time.time()):
+            self.bot.loop.create_task(self.fire(self.pending.pop(id_)))
+
+    @tasks.loop(minutes=10)
+    async def refill(self):
+        async with self.bot.db.acquire() as db:
+            sql = """
+            SELECT *
+            FROM reminders
+            WHERE due_at < $1;
+            """
+
+            records = await db.fetch(sql, datetime.utcnow() + HORIZON)
+
+        for record in records:
+            self.schedule(record)
+
+    @refill.before_loop
+    async def before_refill(self):
+        await self.bot.wait_until_ready()
+
+    async def claim(self, db, record):
+        """Delete the reminder or move it to its next occurrence, if nothing else did already.
+
+        Returns the updated record, ``None`` if it was already claimed."""
+        if record["recurs_every"] is None:
+            sql = """
+            DELETE FROM reminders
+            WHERE id = $1
+            AND due_at = $2
+            RETURNING *;
+            """
+
+            return await db.fetchrow(sql, record["id"], record["due_at"])
+
+        # skip the occurrences missed while offline, they're sent only once
+        now = datetime.utcnow()
+        due_at = record["due_at"]
+        while due_at <= now:
+            due_at += record["recurs_every"]
+
+        sql = """
+        UPDATE reminders
+        SET due_at = $3
+        WHERE id = $1
+        AND due_at = $2
+        RETURNING *;
+        """
+
+        return await db.fetchrow(sql, record["id"], record["due_at"], due_at)
+
+    async def fire(self, record):
+        """Claim and send a reminder in one transaction.
+
+        If sending fails the claim is rolled back, so :meth:`refill` picks the reminder up again."""
+        try:
+            async with self.bot.db.acquire() as db:
+                async with db.transaction():
+                    claimed = await self.claim(db, record)
+                    if claimed is None:
+                        return
+
+                    await self.send(record)
+        except Exception:
+            return LOG.exception("Failed to send reminder %s, retrying it on the next refill", record["id"])
+
+        if claimed["recurs_every"] is not None:
+            self.schedule(claimed)
+
+    async def send(self, record):
+        user = self.bot.get_user(record["user_id"])
+        channel = self.bot.get_channel(record["channel_id"]) or user
+        if channel is None:
+            return LOG.info("Dropping reminder %s, its channel and user are gone", record["id"])
+
+        lateness = datetime.utcnow() - record["due_at"]
+        late = f" (sent {naturaldelta(lateness)} late)" if lateness > timedelta(minutes=1) else ""
+
+        try:
+            await channel.send(f"<@{record['user_id']}>, reminder{late}: {record['content']}")
+        except (discord.Forbidden, discord.NotFound):
+            # won't work any better next time
+            LOG.warning("Dropping reminder %s, it can't be sent", record["id"], exc_info=True)
+
+    async def add_reminder(self, ctx, due_at, content, recurs_every=None):
+        if len(content) > 1500:
+            raise commands.BadArgument("Reminder too long.")
+
+        async with ctx.db.acquire() as db:
+            sql = """
+            INSERT INTO reminders (user_id, channel_id, content, due_at, recurs_every)
+            VALUES ($1, $2, $3, $4, $5)
+            RETURNING *;
+            """
+
+            record = await db.fetchrow(sql, ctx.author.id, ctx.channel.id, content, due_at, recurs_every)
+
+        self.schedule(record)
+        return record
+
+    @commands.group(name="remind", aliases=["reminder", "remindme"], invoke_without_command=True)
+    async def remind(self, ctx, *, when: utils.HumanTime(past_ok=False)):
+        """Get reminded of something.
+
+        The time can be like '1h30m', 'in 3 hours' or 'tomorrow at 9:00', followed by what to be reminded of.
+        All times are in UTC."""
+        record = await self.add_reminder(ctx, when.date, when.arg)
+
+        await ctx.send(f"Reminder {record['id']} set, in {naturaldelta(when.date - ctx.message.created_at)}.")
+
+    @remind.command(name="every")
+    async def remind_every(self, ctx, interval: utils.ShortTime(arg_required=False, past_ok=False), *,
+                           when: utils.HumanTime(past_ok=True)):
+        """Get reminded of something every so often.
+
+        The interval must be in a format like '1d' or '12h', and at least 10 minutes.
+        It's followed by the first time and what to be reminded of, like `remind every 1d 9:00 stand up`.
+        All times are in UTC."""
+        now = ctx.message.created_at
+        every = interval.date - now
+        if every < MIN_INTERVAL:
+            raise commands.BadArgument(f"The interval must be at least {naturaldelta(MIN_INTERVAL)}.")
+
+        due_at = when.date
+        while due_at <= now:
+            due_at += every
+
+        record = await self.add_reminder(ctx, due_at, when.arg, every)
+
+        await ctx.send(f"Reminder {record['id']} set, every {naturaldelta(every)} starting "
+                       f"{utils.fmt_delta(due_at)}.")
+
+    @remind.command(name="list")
+    async def remind_list(self, ctx):
+        """List your reminders."""
+        async with ctx.db.acquire() as db:
+            sql = """
+            SELECT id, content, due_at, recurs_every
+            FROM reminders
+            WHERE user_id = $1
+            ORDER BY due_at;
+            """
+
+            records = await db.fetch(sql, ctx.author.id)
+
+        for chunk in utils.chunks(records, 10):
+            embed = discord.Embed(title=f"Reminders of {ctx.author}")
+            embed.description = ""
+
+            for record in chunk:
+                every = f", every {naturaldelta(record['recurs_every'])}" if record["recurs_every"] else ""
+                embed.description += (f"**{record['id']}** {utils.fmt_delta(record['due_at'])}{every}: "
+                                      f"{utils.trunc_text(record['content'], 100)}\n")
+
+            ctx.pages.add_entry(embed)
+
+        try:
+            await ctx.paginate()
+        except commands.CommandInvokeError:
+            await ctx.send("No reminders.")
+
+    @remind.command(name="delete", aliases=["remove", "cancel"])
+    async def remind_delete(self, ctx, id_: int):
+        """Delete one of your reminders."""
+        async with ctx.db.acquire() as db:
+            sql = """
+            DELETE FROM reminders
+            WHERE id = $1
+            AND user_id = $2
+            RETURNING id;
+            """
+
+            deleted = await db.fetchval(sql, id_, ctx.author.id)
+
+        if deleted is None:
+            raise commands.BadArgument("You don't have a reminder with that id.")
+
+        self.unschedule(id_)
+        await ctx.send(f"Deleted reminder {id_}.")
+
+
+def setup(bot):
+    bot.add_cog(Reminders(bot))
@@ -68,7 +68,7 @@ class API(commands.Cog, name="API", command_attrs=dict(cooldown=commands.Cooldow
             key = ctx.bot.config.tokens.apis.tenor
             self.anon_id = (await ctx.get("https://api.tenor.com/v1/anonid", key=key))["anon_id"]
 
-        resp = await ctx.get("https://api.tenor.com/v1/search", q=gif, anon_id=self.anon_id, limit=5, cache=True)
+        resp = await ctx.get("https://api.tenor.com/v1/search", q=gif, anon_id=self.anon_id, limit=5, cache="swr")
         data = resp["results"]
 
         for entry in data:
@@ -83,7 +83,8 @@ class API(commands.Cog, name="API", command_attrs=dict(cooldown=commands.Cooldow
     @commands.command(name="urbandictionary", aliases=["ud", "urban", "define"])
     async def urban_dictionary(self, ctx, *, word):
         """Get a word's definition on Urban Dictionary."""
-        data = (await ctx.get("https://api.urbandictionary.com/v0/define", term=word))["list"]
+        data = (await ctx.get("https://api.urbandictionary.com/v0/define", term=word,
+                              negative=lambda d: not d["list"], hedge_after="p95"))["list"]
 
         for d in data:
             embed = discord.Embed(title=f"{d['word']} - {d['defid']}",
@@ -216,9 +217,14 @@ class API(commands.Cog, name="API", command_attrs=dict(cooldown=commands.Cooldow
         """Get info on a Pokemon.
 
         Might not be up to date with the latest entries."""
+        if ctx.bot.ezr.is_known_miss("pokeapi/pokemon", name.lower()):
+            return await ctx.send("No results.")
+
         try:
-            pokemon: async_pokepy.Pokemon = await ctx.bot.pokeapi.get_pokemon(name)
+            pokemon: async_pokepy.Pokemon = await ctx.bot.ezr.hedge(lambda: ctx.bot.pokeapi.get_pokemon(name), 500,
+                                                                    host="pokeapi.co")
         except async_pokepy.NotFound:
+            ctx.bot.ezr.remember_miss("pokeapi/pokemon", name.lower())
             return await ctx.send("No results.")
 
         embed = discord.Embed(color=discord.Color(0x008CFF))
@@ -3,7 +3,6 @@ from datetime import datetime
 
 import discord
 from discord.ext import commands
-from lxml import etree
 
 import utils
 
@@ -29,7 +28,8 @@ class Weeb(commands.Cog, command_attrs=dict(cooldown=commands.Cooldown(1, 2.5, c
     @utils.requires_config("tokens", "apis", "osu")
     async def osu(self, ctx, user):
         """Get info on a osu! user."""
-        results = await ctx.get("https://osu.ppy.sh/api/get_user", k=ctx.bot.config.tokens.apis.osu, u=user)
+        results = await ctx.get("https://osu.ppy.sh/api/get_user", k=ctx.bot.config.tokens.apis.osu, u=user,
+                                negative=lambda d: not d)
         try:
             d = results[0]
         except (IndexError, ValueError, TypeError):
@@ -53,7 +53,7 @@ class Weeb(commands.Cog, command_attrs=dict(cooldown=commands.Cooldown(1, 2.5, c
         if d["events"]:
             text = []
             for event in d["events"]:
-                nodes = etree.fromstring(event["display_html"], etree.HTMLParser())
+                nodes = await ctx.parse_html(event["display_html"])
                 k = "".join(nodes.xpath("//text()"))
                 text.append(k)
             fin = "\n".join(text)
@@ -107,6 +107,7 @@ class Weeb(commands.Cog, command_attrs=dict(cooldown=commands.Cooldown(1, 2.5, c
             "https://graphql.anilist.co",
             __json={"query": self.anilist_queries["media"].format(type="ANIME"), "variables": var},
             cache=True,
+            hedge_after="p95",
         )
 
         data = result["data"]["Media"]
@@ -121,6 +122,7 @@ class Weeb(commands.Cog, command_attrs=dict(cooldown=commands.Cooldown(1, 2.5, c
             "https://graphql.anilist.co",
             __json={"query": self.anilist_queries["media"].format(type="MANGA"), "variables": var},
             cache=True,
+            hedge_after="p95",
         )
 
         data = result["data"]["Media"]
@@ -132,7 +134,8 @@ class Weeb(commands.Cog, command_attrs=dict(cooldown=commands.Cooldown(1, 2.5, c
         """Search an anime or manga character on anilist.co."""
         var = {"search": name}
         result = await ctx.post(
-            "https://graphql.anilist.co", __json={"query": self.anilist_queries["char"], "variables": var}, cache=True
+            "https://graphql.anilist.co", __json={"query": self.anilist_queries["char"], "variables": var}, cache=True,
+            hedge_after="p95",
         )
 
         data = result["data"]["Character"]
@@ -24,4 +24,24 @@ create table if not exists prefixes
 );
 
 create unique index if not exists prefixes_guild_id_prefix_uindex
-  on prefixes (guild_id asc, prefix desc);
\ No newline at end of file
+  on prefixes (guild_id asc, prefix desc);
+
+
+create table if not exists reminders
+(
+  id           serial                                                         not null
+    constraint reminders_pk
+      primary key,
+  user_id      bigint                                                         not null,
+  channel_id   bigint                                                         not null,
+  content      varchar(1500)                                                  not null,
+  due_at       timestamp without time zone                                    not null,
+  recurs_every interval,
+  created_at   timestamp without time zone default (now() at time zone 'utc') not null
+);
+
+create index if not exists reminders_due_at_index
+  on reminders (due_at);
+
+create index if not exists reminders_user_id_index
+  on reminders (user_id);
@@ -53,6 +53,7 @@ class TakuruBot(commands.Bot):
         self.ezr = None
         self.pokeapi = None
         self.timers = None
+        self.loop_lag = utils.LoopLagMonitor(self.loop, **(config.get("loop_lag") or {}))
         try:
             self.google_api_keys = itertools.cycle(config.tokens.apis.google_custom_search_api_keys)
             self.google = async_cse.Search(api_key=next(self.google_api_keys))
@@ -121,11 +122,13 @@ class TakuruBot(commands.Bot):
         LOG.info("Removed from guild %s with %s members, owner: %s", guild, guild.member_count, guild.owner)
 
     async def login(self, *args, **kwargs):
+        self.loop_lag.start()
+
         self.redis = await asyncio.wait_for(
             aioredis.create_redis_pool(**self.config.dbs.redis, loop=self.loop, encoding="utf-8"),
             timeout=20.0, loop=self.loop
         )
-        self.timers = utils.TimerManager(self)
+        self.timers = utils.TimerManager(self, **(self.config.get("timers") or {}))
 
         LOG.info("Connected to Redis")
         self.db = await asyncpg.create_pool(**self.config.dbs.psql, loop=self.loop)
@@ -133,6 +136,7 @@ class TakuruBot(commands.Bot):
 
         self.pokeapi = await async_pokepy.connect(loop=self.loop)
         self.ezr = await utils.EasyRequests.start(self)
+        await self.ezr.warmup()
         LOG.info("Finished setting up API stuff")
 
         async with self.db.acquire() as db:
@@ -145,6 +149,7 @@ class TakuruBot(commands.Bot):
         await super().login(*args, **kwargs)
 
     async def close(self):
+        self.loop_lag.stop()
         self.timers.close()
         self.redis.close()
 
@@ -178,21 +183,13 @@ if __name__ == "__main__":
     INIT_TIME = datetime.utcnow()
 
     LOG = logging.getLogger("takuru")
-
-    fmt = logging.Formatter("{asctime} | {levelname: <8} | {module}:{funcName}:{lineno} - {message}",
-                            datefmt="%Y-%m-%d %H:%M:%S", style="{")
-    stream = logging.StreamHandler()
-    stream.setFormatter(fmt)
-
-    files = logging.FileHandler(filename=f"pokecom/takuru{INIT_TIME}.log", mode="w", encoding="utf-8")
-    files.setFormatter(fmt)
-
-    for name in ["utils.ezrequests", "cogs.nsfw", "takuru", "cogs.moderator", "utils.timers"]:
-        k = logging.getLogger(name)
-        k.setLevel(logging.DEBUG)
-        k.handlers = [files, stream]
+    listener = utils.setup_logging(config.get("logging") or {})
 
     bot = TakuruBot()
-    bot.loop.set_debug(True)
+    # debug mode slows down every callback, LoopLagMonitor catches blocking calls instead
+    bot.loop.set_debug(bool(config.get("asyncio_debug")))
 
-    bot.run(bot.config.tokens.discord.kurusu)
+    try:
+        bot.run(bot.config.tokens.discord.kurusu)
+    finally:
+        listener.stop()
@@ -0,0 +1,33 @@
+import asyncio
+import types
+import unittest
+
+from multidict import CIMultiDict
+
+from utils.config import Config
+from utils.ezrequests import EasyRequests
+
+
+class FmtCacheTest(unittest.TestCase):
+    def setUp(self):
+        bot = types.SimpleNamespace(loop=asyncio.get_event_loop(), config=Config.from_dict({}))
+        self.ezr = EasyRequests(bot, None)
+
+    def tearDown(self):
+        self.ezr.executor.shutdown()
+
+    def key(self, headers):
+        return self.ezr.fmt_cache("GET", "https://example.com/", {"__headers": headers})
+
+    def test_headers_mapping_types(self):
+        expected = self.key({"Accept": "application/json", "User-Agent": "a"})
+
+        self.assertEqual(self.key(CIMultiDict({"accept": "application/json", "User-Agent": "b"})), expected)
+        self.assertEqual(self.key([("ACCEPT", "application/json")]), expected)
+
+    def test_relevant_headers_change_key(self):
+        self.assertNotEqual(self.key(CIMultiDict(Authorization="a")), self.key(CIMultiDict(Authorization="b")))
+
+
+if __name__ == "__main__":
+    unittest.main()
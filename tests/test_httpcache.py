@@ -0,0 +1,95 @@
+import asyncio
+import os
+import time
+import unittest
+
+import aioredis
+
+from utils.httpcache import CacheEntry, RedisCacheTier, msgpack
+
+# a throwaway server is best, only keys under the test prefix are touched though
+REDIS_URL = os.environ.get("TEST_REDIS_URL", "redis://localhost:6379")
+
+
+class RedisCacheTierTest(unittest.TestCase):
+    """Needs a reachable Redis, skipped otherwise."""
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+        try:
+            self.redis = self.run_async(aioredis.create_redis_pool(REDIS_URL, encoding="utf-8"))
+        except (aioredis.RedisError, OSError) as exc:
+            self.loop.close()
+            self.skipTest(f"No Redis at {REDIS_URL} [{type(exc).__name__}: {exc}]")
+
+        self.tier = RedisCacheTier(self.redis, prefix="test:ezr-cache:", max_entry_bytes=4096, stale_ttl=60)
+        self.run_async(self.tier.clear())
+
+    def tearDown(self):
+        self.run_async(self.tier.clear())
+        self.redis.close()
+        self.run_async(self.redis.wait_closed())
+        self.loop.close()
+
+    def run_async(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    async def ttl(self, key):
+        return await self.redis.ttl(self.tier._key(key))
+
+    def test_round_trip(self):
+        entry = CacheEntry("https://example.com/a", {"a": [1, 2]}, 32, 60, etag='"x"')
+
+        self.assertTrue(self.run_async(self.tier.put(b"a" * 16, entry)))
+        fetched = self.run_async(self.tier.get(b"a" * 16))
+
+        self.assertEqual(fetched.to_parts(), entry.to_parts())
+        self.assertEqual(self.tier.stats(), {"hits": 1, "misses": 0, "skipped": 0})
+
+    def test_binary_round_trip(self):
+        entry = CacheEntry("https://example.com/b", bytes(range(256)), 256, 60)
+        stored = self.run_async(self.tier.put(b"b" * 16, entry))
+        fetched = self.run_async(self.tier.get(b"b" * 16))
+
+        if msgpack is None:
+            # JSON can't hold raw bytes, so they're not stored at all
+            self.assertFalse(stored)
+            self.assertIsNone(fetched)
+        else:
+            self.assertTrue(stored)
+            self.assertEqual(fetched.data, entry.data)
+
+    def test_ttls(self):
+        self.run_async(self.tier.put(b"c" * 16, CacheEntry("https://example.com/c", "c", 1, 30)))
+        self.run_async(self.tier.put(b"d" * 16, CacheEntry("https://example.com/d", "d", 1, 30, etag='"d"')))
+
+        self.assertAlmostEqual(self.run_async(self.ttl(b"c" * 16)), 30, delta=1)
+        # revalidatable entries are kept stale_ttl longer
+        self.assertAlmostEqual(self.run_async(self.ttl(b"d" * 16)), 90, delta=1)
+
+    def test_expires(self):
+        self.run_async(self.tier.put(b"e" * 16, CacheEntry("https://example.com/e", "e", 1, 1)))
+        time.sleep(1.5)
+
+        self.assertIsNone(self.run_async(self.tier.get(b"e" * 16)))
+        self.assertEqual(self.tier.misses, 1)
+
+    def test_oversized(self):
+        entry = CacheEntry("https://example.com/f", os.urandom(8192).hex(), 16384, 60)
+
+        self.assertFalse(self.run_async(self.tier.put(b"f" * 16, entry)))
+        self.assertIsNone(self.run_async(self.tier.get(b"f" * 16)))
+        self.assertEqual(self.tier.skipped, 1)
+
+    def test_clear(self):
+        for i in range(3):
+            self.run_async(self.tier.put(bytes([i]) * 16, CacheEntry(f"https://example.com/{i}", "x", 1, 60)))
+
+        self.assertEqual(self.run_async(self.tier.clear()), 3)
+        self.assertIsNone(self.run_async(self.tier.get(b"\0" * 16)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -7,7 +7,10 @@ from .defaults import *  # noqa: F401
 from .emotes import *  # noqa: F401
 from .ezrequests import EasyRequests  # noqa: F401
 from .formats import PaginationError, Paginator, Plural, Tabulator  # noqa: F401
+from .logs import setup_logging  # noqa: F401
+from .looplag import LoopLagMonitor  # noqa: F401
 from .timers import TimerManager  # noqa: F401
+from .timingwheel import TimingWheel  # noqa: F401
 from .context import RightSiderContext  # noqa: F401
 from .waveobj import Player, Track  # noqa: F401
 
@@ -0,0 +1,53 @@
+import logging
+import random
+
+from .ratelimit import TokenBucket
+
+
+class BodyLogger:
+    """Logs truncated previews of response bodies, sampled and rate limited.
+
+    Every record carries ``host``, ``status``, ``bytes`` and ``ms`` as extra fields, for structured handlers.
+    Error responses are always previewed (unless rate limited), successful ones only ``sample_rate`` of the time."""
+    __slots__ = ("log", "max_chars", "sample_rate", "bucket", "suppressed")
+
+    TEXT_TYPES = ("application/json", "text/", "application/xml", "application/javascript")
+
+    def __init__(self, log, config):
+        self.log = log
+        self.max_chars = config.get("max_chars", 512)
+        self.sample_rate = config.get("sample_rate", 0.1)
+        per_minute = config.get("per_minute", 60)
+        self.bucket = TokenBucket(per_minute, 60.0)
+
+        # previews dropped by the rate limit since the last one that was logged
+        self.suppressed = 0
+
+    def preview(self, body, content_type):
+        if not any(t in content_type for t in self.TEXT_TYPES):
+            return f"<{len(body)} bytes of {content_type or 'unknown type'}>"
+
+        if len(body) <= self.max_chars:
+            return body.decode("utf-8", "replace")
+
+        return body[:self.max_chars].decode("utf-8", "replace") + f"... ({len(body)} bytes total)"
+
+    def __call__(self, r, body, elapsed):
+        if not self.log.isEnabledFor(logging.DEBUG):
+            return
+
+        error = not 300 > r.status >= 200
+        if not error and random.random() >= self.sample_rate:
+            return
+
+        if self.bucket.delay() > 0:
+            self.suppressed += 1
+            return
+        self.bucket.reserve()
+
+        fields = {"host": r.url.host, "status": r.status, "bytes": len(body), "ms": round(elapsed * 1000, 2)}
+        suppressed, self.suppressed = self.suppressed, 0
+
+        self.log.debug("%s %s %s %sB %.2fms body: %s%s", r.status, r.method, r.url, fields["bytes"], fields["ms"],
+                       self.preview(body, r.headers.get("Content-Type", "")),
+                       f" ({suppressed} previews suppressed)" if suppressed else "", extra=fields)
@@ -0,0 +1,70 @@
+import time
+
+
+class CircuitBreaker:
+    """Stops sending requests to a host after too many consecutive failures.
+
+    Once ``reset_timeout`` seconds have passed a single probe request is let through,
+    its outcome closes the breaker again or keeps it open."""
+    __slots__ = ("threshold", "reset_timeout", "state", "failures", "trips", "opened_at", "probe_started")
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, threshold=5, reset_timeout=30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.opened_at = 0.0
+        self.probe_started = 0.0
+
+    @property
+    def retry_after(self):
+        if self.state == self.CLOSED:
+            return 0.0
+
+        return max(self.opened_at + self.reset_timeout - time.monotonic(), 0.0)
+
+    def allow(self):
+        if self.state == self.CLOSED:
+            return True
+
+        now = time.monotonic()
+
+        if self.state == self.OPEN:
+            if now - self.opened_at < self.reset_timeout:
+                return False
+
+            self.state = self.HALF_OPEN
+            self.probe_started = now
+            return True
+
+        # a probe is in flight, let another one through only if that one got lost somehow
+        if now - self.probe_started >= self.reset_timeout:
+            self.probe_started = now
+            return True
+
+        return False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.threshold):
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.trips += 1
+
+    def reset(self):
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def __repr__(self):
+        return f"<CircuitBreaker state={self.state!r} failures={self.failures} trips={self.trips}>"
@@ -34,6 +34,21 @@ class RightSiderContext(commands.Context):
     async def get(self, *args, **kwargs):
         return await self._request("GET", *args, **kwargs)
 
+    async def stream(self, url, *, max_bytes=None, **params):
+        """Download ``url`` to a file object that can be passed straight to :class:`discord.File`.
+
+        ``max_bytes`` defaults to this guild's upload limit."""
+        if max_bytes is None:
+            max_bytes = self.guild.filesize_limit if self.guild else 8 * 1024 * 1024
+
+        return await self.bot.ezr.download("GET", url, max_bytes=max_bytes, **params)
+
+    async def parse_html(self, html):
+        return await self.bot.ezr.parse_html(html)
+
+    async def scrape(self, url, **kwargs):
+        return await self.bot.ezr.scrape(url, **kwargs)
+
     async def post_to_mystbin(self, content, ex="", **kwargs):
         try:
             haste = await self.post("https://mystb.in/documents", __data=content)
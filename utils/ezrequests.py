@@ -1,8 +1,23 @@
 import asyncio
+import concurrent.futures
+import hashlib
 import logging
+import random
+import struct
+import tempfile
+import time
 
 import aiohttp
-from lru import LRU
+from lxml import etree
+from yarl import URL
+
+from .bodylog import BodyLogger
+from .breaker import CircuitBreaker
+from .httpcache import CacheEntry, CacheSnapshot, RedisCacheTier, ResponseCache, parse_ttl
+from .httpstats import HTTPStats
+from .lanes import PriorityLanes
+from .ratelimit import HostRateLimiter
+from .replay import Recording, RecordingSession, ReplaySession
 
 try:
     import ujson as json
@@ -12,6 +27,35 @@ except ImportError:
 LOG = logging.getLogger("utils.ezrequests")
 
 
+def decode_body(body, content_type):
+    if "application/json" in content_type:
+        return json.loads(body)
+    if "text/" in content_type:
+        return body.decode("utf-8")
+
+    return body
+
+
+def parse_html(html):
+    return etree.fromstring(html, etree.HTMLParser())
+
+
+def stop_after(tag, count=1, attrs=None):
+    """Build an ``until`` predicate for :meth:`EasyRequests.scrape`,
+    true once ``count`` ``tag`` elements with the given attributes were parsed."""
+    attrs = attrs or {}
+    seen = 0
+
+    def until(element):
+        nonlocal seen
+        if element.tag == tag and all(element.get(k) == v for k, v in attrs.items()):
+            seen += 1
+
+        return seen >= count
+
+    return until
+
+
 class WebException(Exception):
     __slots__ = ("r", "status", "data")
 
@@ -23,75 +67,786 @@ class WebException(Exception):
         super().__init__(f"{self.r.method} {self.r.url} responded with HTTP status code {self.status}\n{self.data}")
 
 
+class RateLimited(WebException):
+    __slots__ = ("host", "retry_after")
+
+    def __init__(self, host, retry_after, response=None, data=None):
+        self.r = response
+        self.status = 429
+        self.data = data
+        self.host = host
+        self.retry_after = retry_after
+
+        Exception.__init__(self, f"Rate limited by {host}, retry in {retry_after:.2f} seconds")
+
+
+class CircuitOpen(WebException):
+    __slots__ = ("host", "retry_after")
+
+    def __init__(self, host, retry_after):
+        self.r = None
+        self.status = None
+        self.data = None
+        self.host = host
+        self.retry_after = retry_after
+
+        Exception.__init__(self, f"Circuit breaker for {host} is open, retry in {retry_after:.2f} seconds")
+
+
+class PayloadTooLarge(Exception):
+    __slots__ = ("url", "max_bytes")
+
+    def __init__(self, url, max_bytes):
+        self.url = url
+        self.max_bytes = max_bytes
+
+        super().__init__(f"{url} is bigger than {max_bytes} bytes")
+
+
+class CachedResponse:
+    """Stands in for the response of a cached failed request."""
+    __slots__ = ("method", "url", "status", "data")
+
+    def __init__(self, response, data):
+        self.method = response.method
+        self.url = response.url
+        self.status = response.status
+        self.data = data
+
+
+class RequestInfo:
+    __slots__ = ("method", "url", "host", "key", "cache", "negative", "priority", "hedge_after", "entry", "params",
+                 "kwargs")
+
+    def __init__(self, method, url, key, cache, negative, priority, hedge_after, params):
+        self.method = method
+        self.url = url
+        self.host = URL(url).host
+        self.key = key
+        self.cache = cache
+        self.negative = negative
+        self.priority = priority
+        self.hedge_after = hedge_after
+        self.entry = None
+
+        self.params = {k: v for k, v in params.items() if not k.startswith("__")}
+        self.kwargs = {k.lstrip("_"): v for k, v in params.items() if k.startswith("__")}
+
+
 class EasyRequests:
-    __slots__ = ("bot", "loop", "session", "lock", "cache")
+    __slots__ = ("bot", "loop", "session", "sessions", "cache", "l2", "ratelimits", "breakers", "stats",
+                 "negative", "lanes", "executor", "body_log", "snapshot", "_snapshot_task", "_snapshot_lock",
+                 "_inflight")
+
+    # only these get coalesced (unless cached) or retried, two identical POSTs are still two POSTs
+    COALESCE_METHODS = frozenset({"GET", "HEAD"})
+    # headers that can change the response and so are part of the cache key
+    KEY_HEADERS = frozenset({"accept", "accept-language", "authorization", "content-type", "cookie"})
+    RETRY_STATUSES = frozenset({500, 502, 503, 504})
+    HEDGE_MIN_SAMPLES = 20
 
-    def __init__(self, bot, session):
+    def __init__(self, bot, session, sessions=None):
         self.bot = bot
         self.loop = bot.loop
         self.session = session
+        # {host: session}, for hosts using a connector profile other than the default one
+        self.sessions = sessions or {}
+
+        config = self.config.get("cache", {})
+        self.cache = ResponseCache(config.get("max_bytes", 32 * 1024 * 1024), config.get("default_ttl", 300),
+                                   config.get("max_stale", 86400))
+
+        negative = config.get("negative", {})
+        self.negative = ResponseCache(negative.get("max_bytes", 1024 * 1024), negative.get("ttl", 60))
+
+        snapshot = config.get("snapshot", {})
+        self.snapshot = CacheSnapshot(snapshot.get("path", "http_cache.bin")) if snapshot.get("enabled") else None
+        self._snapshot_task = None
+        # a save can't be interrupted once it's in the executor, this keeps two from writing at once
+        self._snapshot_lock = asyncio.Lock()
+
+        redis_config = dict(config.get("redis", {}))
+        if redis_config.pop("enabled", False) and getattr(bot, "redis", None) is not None:
+            self.l2 = RedisCacheTier(bot.redis, **redis_config)
+            LOG.info("Using Redis as second cache tier.")
+        else:
+            self.l2 = None
 
-        self.lock = asyncio.Lock(loop=bot.loop)
-        self.cache = LRU(64)
+        self.ratelimits = HostRateLimiter(self.config.get("ratelimits", {}))
+        self.breakers = {}
+        self.lanes = PriorityLanes(self.config.get("lanes", {}))
+        self.body_log = BodyLogger(LOG, self.config.get("body_log", {}))
+        self.stats = HTTPStats()
+        self._inflight = {}
+
+        # not the default executor, so big pages can't hold up DNS lookups
+        self.executor = concurrent.futures.ThreadPoolExecutor(self.config.get("offload", {}).get("workers", 2),
+                                                              thread_name_prefix="ezr-offload")
 
     @classmethod
     async def start(cls, bot):
-        session = aiohttp.ClientSession(loop=bot.loop, headers=bot.http_headers, json_serialize=json.dumps)
+        config = bot.config.get("http") or {}
+        connectors = config.get("connectors", {})
+        replay = config.get("replay", {})
+
+        if replay.get("mode") == "replay":
+            LOG.warning("Replaying HTTP responses from %s, no requests will be made.", replay["path"])
+            ezr = cls(bot, ReplaySession(Recording(replay["path"])))
+            # replayed responses must not end up in the real snapshot
+            ezr.snapshot = None
+            return ezr
+
+        timeout = aiohttp.ClientTimeout(total=config.get("timeout", 30))
+
+        def make_session(profile):
+            connector = aiohttp.TCPConnector(loop=bot.loop, **profile)
+            return aiohttp.ClientSession(loop=bot.loop, connector=connector, headers=bot.http_headers,
+                                         json_serialize=json.dumps, timeout=timeout)
+
+        default = connectors.get("default", {})
+        session = make_session(default)
+        sessions = {}
+
+        for name, profile in connectors.get("profiles", {}).items():
+            profile = {**default, **profile}
+            hosts = profile.pop("hosts", [])
+            profile_session = make_session(profile)
+
+            for host in hosts:
+                sessions[host] = profile_session
+
+            LOG.info("Opened session for connector profile %s (%s)", name, ", ".join(hosts))
+
+        if replay.get("mode") == "record":
+            LOG.warning("Recording HTTP responses to %s.", replay["path"])
+            session, sessions = RecordingSession.wrap(Recording(replay["path"]), session, sessions)
+
         LOG.info("Session opened.")
-        return cls(bot, session)
+        ezr = cls(bot, session, sessions)
 
-    def fmt_cache(self, m, url, param):
-        p = ":".join([f"{k}:{v}" for k, v in param.items()])
-        return f"{m}:{url}:{p}"
+        if ezr.snapshot is not None:
+            ezr.restore_snapshot()
+            ezr._snapshot_task = ezr.loop.create_task(ezr._snapshot_loop())
 
-    def clear_cache(self, new_size=64):
-        self.cache = LRU(new_size)
-        LOG.info("Cleared cache, size set to %s", new_size)
+        return ezr
 
-    async def request(self, __method, __url, *, cache=False, **params):
-        async with self.lock:
-            check = self.cache.get(self.fmt_cache(__method, __url, params), None)
-            if check and cache:
-                LOG.debug("%s %s Got %s from cache", __method, __url, check)
-                return check
+    @property
+    def config(self):
+        return self.bot.config.get("http") or {}
 
-            kwargs = {k.lstrip("_"): v for k, v in params.items() if k.startswith("__")}
-            cache_params = params.copy()
+    def session_for(self, host):
+        return self.sessions.get(host, self.session)
 
-            for key in cache_params.keys():
-                if key.startswith("__"):
-                    del params[key]
+    async def warmup(self):
+        """Resolve and open keepalive connections to the hosts in ``http.warmup``.
 
-            async with self.session.request(__method, __url, params=params, **kwargs) as r:
-                if "application/json" in r.headers["Content-Type"]:
-                    data = await r.json(loads=json.loads)
-                elif "text/" in r.headers["Content-Type"]:
-                    data = await r.text("utf-8")
-                else:
-                    data = await r.read()
+        Failures are only logged, this is best effort."""
+        config = self.config.get("warmup", {})
+        hosts = config.get("hosts", [])
+        connections = config.get("connections", 1)
+        timeout = aiohttp.ClientTimeout(total=config.get("timeout", 5))
 
-                request_fmt = f"{r.status} {r.method} {r.url}"
+        async def connect(target):
+            url = target if "://" in target else f"https://{target}/"
+            session = self.session_for(URL(url).host)
+            started = time.perf_counter()
 
-                LOG.debug("%s returned %s", request_fmt, data)
+            try:
+                async with session.head(url, allow_redirects=False, timeout=timeout):
+                    pass
+            except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                LOG.warning("Failed to warm up %s [%s: %s]", url, type(exc).__name__, exc)
+            else:
+                LOG.debug("Warmed up %s in %.2fms", url, (time.perf_counter() - started) * 1000)
 
-                if 300 > r.status >= 200 or __url == "https://www.zerochan.net/search":
-                    LOG.info("%s succeeded", request_fmt)
-                    if cache:
-                        self.cache[self.fmt_cache(__method, __url, cache_params)] = data
-                        LOG.debug("%s Inserted data into cache", request_fmt)
-                    return data
+        await asyncio.gather(*[connect(host) for host in hosts for _ in range(connections)])
+        LOG.info("Warmed up connections to %s hosts", len(hosts))
 
-                if r.status == 429:
-                    LOG.warning("%s RATE LIMITED", request_fmt)
-                    raise WebException(r, data)
+    @property
+    def offload_threshold(self):
+        return self.config.get("offload", {}).get("threshold", 64 * 1024)
+
+    async def parse_html(self, html):
+        """Parse an HTML page with lxml, in a thread if it's bigger than ``http.offload.threshold``.
+
+        lxml releases the GIL while parsing, so the event loop keeps running meanwhile."""
+        if len(html) > self.offload_threshold:
+            return await self.loop.run_in_executor(self.executor, parse_html, html)
+
+        return parse_html(html)
+
+    def breaker(self, host):
+        try:
+            return self.breakers[host]
+        except KeyError:
+            config = self.config.get("breaker", {})
+            self.breakers[host] = ret = CircuitBreaker(config.get("threshold", 5), config.get("reset_timeout", 30.0))
+
+            return ret
+
+    def fmt_cache(self, m, url, params):
+        """Build a cache key out of the method, URL, query parameters, body and relevant headers of a request."""
+        h = hashlib.blake2b(digest_size=16)
+
+        def update(*parts):
+            for part in parts:
+                h.update(part if isinstance(part, bytes) else str(part).encode())
+                h.update(b"\0")
+
+        update(m.upper(), url)
+
+        for k, v in sorted((k, str(v)) for k, v in params.items() if not k.startswith("__")):
+            update(k, v)
+
+        if "__json" in params:
+            update("json", json.dumps(params["__json"], sort_keys=True))
+
+        data = params.get("__data")
+        if isinstance(data, dict):
+            update("form", *[f"{k}={v}" for k, v in sorted(data.items())])
+        elif data is not None:
+            update("data", data)
+
+        headers = params.get("__headers")
+        if headers:
+            items = headers.items() if hasattr(headers, "items") else headers
+            update("headers", *sorted(f"{k.lower()}:{v}" for k, v in items if k.lower() in self.KEY_HEADERS))
+
+        return h.digest()
+
+    async def clear_cache(self, *, host=None, prefix=None, max_bytes=None):
+        """Purge the in-process cache tiers, and the Redis one too if neither ``host`` nor ``prefix`` are passed.
+
+        Returns how many entries were purged from each, the Redis count is ``None`` if it wasn't touched."""
+        count = self.cache.purge(host=host, prefix=prefix) + self.negative.purge(host=host, prefix=prefix)
+        if max_bytes is not None:
+            self.cache.resize(max_bytes)
+
+        l2_count = None
+        if self.l2 is not None and host is None and prefix is None:
+            l2_count = await self.l2.clear()
+
+        LOG.info("Purged %s cache entries and %s from Redis (host: %s, prefix: %s), max size is %s bytes",
+                 count, l2_count, host, prefix, self.cache.max_bytes)
+        return count, l2_count
+
+    async def request(self, __method, __url, *, cache=False, negative=None, priority="interactive", hedge_after=None,
+                      **params):
+        """Make an HTTP request and return the decoded body.
+
+        ``cache`` can be ``True``, to use the TTL the server sends (or the default one),
+        a number of seconds to cache the response for or ``"swr"`` (stale while revalidate),
+        which behaves like ``True`` but returns expired entries right away and refreshes them in the background.
+        ``negative`` can be ``True``, to briefly remember 404s and 410s,
+        or a callable that is passed the decoded body and returns whether it's an empty result worth remembering.
+        ``priority`` is either ``"interactive"`` or ``"background"``, background requests have their own,
+        smaller concurrency budget and always let interactive ones go first.
+        ``hedge_after`` is an amount of milliseconds, or ``"p95"`` for the route's tracked 95th percentile,
+        after which a duplicate request is sent if there's no response yet, the first to answer wins.
+        Only use it for idempotent requests.
+        Parameters starting with ``__`` are passed to :meth:`aiohttp.ClientSession.request`,
+        all others are used as query parameters."""
+        info = RequestInfo(__method, __url, self.fmt_cache(__method, __url, params), cache, negative, priority,
+                           hedge_after, params)
+
+        if negative:
+            miss = self.negative.get(info.key)
+            if miss is not None and not miss.expired:
+                LOG.debug("%s %s Got negative result %s from cache", __method, __url, miss)
+                self.stats.count(info.host, "negative_hit")
+
+                if isinstance(miss.data, CachedResponse):
+                    raise WebException(miss.data, miss.data.data)
+                return miss.data
+
+        entry = info.entry = self.cache.get(info.key) if cache else None
+        if entry is not None and not entry.expired:
+            LOG.debug("%s %s Got %s from cache", __method, __url, entry)
+            self.stats.count(info.host, "hit")
+            return entry.data
+
+        if cache == "swr" and entry is not None and time.time() - entry.expires < self.cache.max_stale:
+            LOG.debug("%s %s Got stale %s from cache, refreshing it", __method, __url, entry)
+            self.stats.count(info.host, "stale")
+            info.priority = "background"
+            self._inflight_task(info)
+            return entry.data
+
+        if cache:
+            self.stats.count(info.host, "miss")
+
+        # bodies are part of the key, so cached POSTs are safe to coalesce as well
+        if __method not in self.COALESCE_METHODS and not cache:
+            return await self._fetch(info)
+
+        if info.key in self._inflight:
+            LOG.debug("%s %s Waiting on in-flight request", __method, __url)
+            self.stats.count(info.host, "coalesced")
+
+        task = self._inflight_task(info)
+
+        # shielded so a cancelled command doesn't cancel the request for everyone else waiting on it
+        return await asyncio.shield(task)
+
+    def _inflight_task(self, info):
+        try:
+            return self._inflight[info.key]
+        except KeyError:
+            task = self.loop.create_task(self._fetch(info))
+            task.add_done_callback(lambda t: self._request_done(info.key, t))
+            self._inflight[info.key] = task
+
+            return task
+
+    async def _fetch(self, info):
+        if info.hedge_after is None:
+            return await self._request(info)
+
+        if info.hedge_after == "p95":
+            latency = self.stats.route_for(info.url).latency
+            # not enough samples to know what slow means yet
+            if latency.count < self.HEDGE_MIN_SAMPLES:
+                return await self._request(info)
+
+            hedge_after = latency.quantile(0.95)
+        else:
+            hedge_after = info.hedge_after
+
+        return await self.hedge(lambda: self._request(info), hedge_after, host=info.host)
+
+    async def hedge(self, factory, after, *, host=None):
+        """Await ``factory()``, calling it a second time if it didn't finish within ``after`` milliseconds.
+
+        Returns the first result, the other call is cancelled.
+        Also usable for API wrappers that don't go through :meth:`request`, like pokeapi's."""
+        first = self.loop.create_task(factory())
+        pending = {first}
+
+        try:
+            done, _ = await asyncio.wait(pending, timeout=after / 1000)
+            if not done:
+                LOG.debug("No response from %s after %sms, hedging", host, after)
+                self.stats.count(host, "hedge_fired")
+                pending.add(self.loop.create_task(factory()))
+
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
 
-                if r.status in {500, 502}:
-                    LOG.warning("%s INTERNAL ERROR", request_fmt)
-                    raise WebException(r, data)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.stats.count(host, "hedge_won")
+                        return task.result()
 
-                LOG.error("%s errored.", request_fmt)
+                    # only give up once both failed
+                    if error is None or task is first:
+                        error = task.exception()
+
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def is_known_miss(self, namespace, query):
+        """Check if a lookup made outside of :meth:`request`, like pokeapi's, recently found nothing."""
+        miss = self.negative.get(self.fmt_cache("MISS", namespace, {"q": query}))
+
+        return miss is not None and not miss.expired
+
+    def remember_miss(self, namespace, query):
+        self.negative.put(self.fmt_cache("MISS", namespace, {"q": query}),
+                          CacheEntry(namespace, None, len(query), self.negative.default_ttl))
+
+    async def stream(self, __method, __url, *, max_bytes=None, chunk_size=64 * 1024, priority="interactive",
+                     allow_errors=False, **params):
+        """Yield the response body in chunks, it's neither decoded nor cached.
+
+        Raises :exc:`PayloadTooLarge` as soon as the body is known to be bigger than ``max_bytes``.
+        Bodies of error responses (except 429s) are streamed as well if ``allow_errors`` is true."""
+        kwargs = {k.lstrip("_"): v for k, v in params.items() if k.startswith("__")}
+        params = {k: v for k, v in params.items() if not k.startswith("__")}
+        host = URL(__url).host
+        breaker = self._check_breaker(host)
+
+        await self._acquire(host, priority)
+        started = time.perf_counter()
+
+        try:
+            r = await self.session_for(host).request(__method, __url, params=params, **kwargs)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            self.lanes.release(priority)
+            breaker.record_failure()
+            self.stats.observe(__url, "error", time.perf_counter() - started)
+            raise
+        except BaseException:
+            self.lanes.release(priority)
+            raise
+
+        chunks = self._stream_response(r, host, breaker, max_bytes, chunk_size, allow_errors, started)
+        try:
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            # when the consumer stops early this closes the response now instead of when the generator is collected
+            await chunks.aclose()
+            self.lanes.release(priority)
+
+    async def _stream_response(self, r, host, breaker, max_bytes, chunk_size, allow_errors, started):
+        async with r:
+            retry_after = self.ratelimits.update(host, r.status, r.headers)
+            self._record(breaker, r.status)
+
+            if not 300 > r.status >= 200 and (r.status == 429 or not allow_errors):
+                data = await r.read()
+                self.stats.observe(r.url, r.status, time.perf_counter() - started, len(data))
+                LOG.error("%s %s %s errored.", r.status, r.method, r.url)
+
+                if r.status == 429:
+                    raise RateLimited(host, retry_after or 0.0, r, data)
                 raise WebException(r, data)
 
+            if max_bytes is not None and (r.content_length or 0) > max_bytes:
+                raise PayloadTooLarge(r.url, max_bytes)
+
+            read = 0
+            try:
+                async for chunk in r.content.iter_chunked(chunk_size):
+                    read += len(chunk)
+                    if max_bytes is not None and read > max_bytes:
+                        raise PayloadTooLarge(r.url, max_bytes)
+
+                    yield chunk
+            finally:
+                # also when the consumer stopped early
+                self.stats.observe(r.url, r.status, time.perf_counter() - started, read)
+
+            LOG.info("%s %s %s streamed %s bytes", r.status, r.method, r.url, read)
+
+    async def scrape(self, __url, *, until, cache=False, allow_errors=False, chunk_size=16 * 1024, **params):
+        """Parse an HTML page while it's downloaded, stopping as soon as ``until`` returns true.
+
+        ``until`` is called with every element once its end tag was parsed, see :func:`stop_after`.
+        The connection is closed right away, the rest of the page is never downloaded.
+        Returns the root of what was parsed so far, ``None`` if that's nothing (like with an empty body),
+        the part that was read is cached if ``cache`` is set."""
+        key = self.fmt_cache("SCRAPE", __url, params)
+        host = URL(__url).host
+
+        entry = self.cache.get(key) if cache else None
+        if entry is not None and not entry.expired:
+            LOG.debug("GET %s Got %s from cache", __url, entry)
+            self.stats.count(host, "hit")
+            return await self.parse_html(entry.data)
+
+        if cache:
+            self.stats.count(host, "miss")
+
+        parser = etree.HTMLPullParser(events=("end",))
+        body = []
+        chunks = self.stream("GET", __url, chunk_size=chunk_size, allow_errors=allow_errors, **params)
+
+        try:
+            async for chunk in chunks:
+                body.append(chunk)
+                parser.feed(chunk)
+
+                if any(until(element) for _, element in parser.read_events()):
+                    LOG.debug("GET %s Got everything needed after %s bytes", __url, sum(map(len, body)))
+                    break
+        finally:
+            await chunks.aclose()
+
+        try:
+            root = parser.close()
+        except etree.XMLSyntaxError:
+            LOG.debug("GET %s Nothing to parse in %s bytes", __url, sum(map(len, body)))
+            return None
+
+        if cache:
+            body = b"".join(body)
+            ttl = self.cache.default_ttl if cache is True or cache == "swr" else cache
+            self._store(key, CacheEntry(__url, body, len(body), ttl))
+
+        return root
+
+    async def download(self, __method, __url, *, max_bytes=None, spool_size=1024 * 1024, **params):
+        """Download the response body in a :class:`tempfile.SpooledTemporaryFile`.
+
+        The body is kept in memory until it's bigger than ``spool_size``, then moved to disk."""
+        fp = tempfile.SpooledTemporaryFile(max_size=spool_size)
+
+        try:
+            async for chunk in self.stream(__method, __url, max_bytes=max_bytes, **params):
+                fp.write(chunk)
+        except BaseException:
+            fp.close()
+            raise
+
+        fp.seek(0)
+        return fp
+
+    def _request_done(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+        # mark the exception as retrieved, in case every waiter got cancelled
+        if not task.cancelled():
+            task.exception()
+
+    async def _request(self, info):
+        host = info.host
+        kwargs = info.kwargs.copy()
+
+        if info.cache and self.l2 is not None:
+            shared = await self.l2.get(info.key)
+
+            if shared is not None and not shared.expired:
+                LOG.debug("%s %s Got %s from Redis", info.method, info.url, shared)
+                self.stats.count(host, "redis_hit")
+                self.cache.put(info.key, shared)
+                return shared.data
+
+            if shared is not None and (info.entry is None or shared.expires > info.entry.expires):
+                info.entry = shared
+
+        if info.entry is not None and info.entry.revalidatable:
+            kwargs["headers"] = {**dict(kwargs.get("headers") or {}), **info.entry.conditional_headers()}
+
+        retry = self.config.get("retries", {})
+        attempts = retry.get("attempts", 2) if info.method in self.COALESCE_METHODS else 0
+        retried_429 = False
+        attempt = 0
+
+        while True:
+            breaker = self._check_breaker(host)
+            await self._acquire(host, info.priority)
+            started = time.perf_counter()
+
+            try:
+                async with self.session_for(host).request(info.method, info.url, params=info.params, **kwargs) as r:
+                    retry_after = self.ratelimits.update(host, r.status, r.headers)
+                    self._record(breaker, r.status)
+
+                    if r.status == 429 and not retried_429 and retry_after is not None \
+                            and retry_after <= self.ratelimits.max_wait:
+                        self.stats.observe(r.url, r.status, time.perf_counter() - started)
+                        LOG.warning("%s %s RATE LIMITED, retrying in %.2f seconds", info.method, r.url, retry_after)
+                        retried_429 = True
+                        continue
+
+                    if r.status not in self.RETRY_STATUSES or attempt >= attempts:
+                        return await self._handle_response(r, info, retry_after, started)
+
+                    self.stats.observe(r.url, r.status, time.perf_counter() - started)
+                    LOG.warning("%s %s %s errored, retrying (attempt %s of %s)",
+                                r.status, info.method, r.url, attempt + 1, attempts)
+            except asyncio.TimeoutError:
+                # already took the whole session timeout, retrying would only keep the user waiting longer
+                breaker.record_failure()
+                self.stats.observe(info.url, "error", time.perf_counter() - started)
+                raise
+            except aiohttp.ClientConnectionError as exc:
+                breaker.record_failure()
+                self.stats.observe(info.url, "error", time.perf_counter() - started)
+
+                if attempt >= attempts:
+                    raise
+
+                LOG.warning("%s %s failed [%s: %s], retrying (attempt %s of %s)",
+                            info.method, info.url, type(exc).__name__, exc, attempt + 1, attempts)
+            finally:
+                self.lanes.release(info.priority)
+
+            # "full jitter" exponential backoff
+            await asyncio.sleep(random.uniform(0, min(retry.get("backoff_cap", 2.0),
+                                                      retry.get("backoff_base", 0.25) * 2 ** attempt)))
+            attempt += 1
+
+    def _check_breaker(self, host):
+        breaker = self.breaker(host)
+
+        if not breaker.allow():
+            raise CircuitOpen(host, breaker.retry_after)
+
+        return breaker
+
+    def _record(self, breaker, status):
+        if status in self.RETRY_STATUSES:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+    async def _acquire(self, host, priority):
+        """Wait for a concurrency slot in the priority's lane, then for a rate limit slot for the host.
+
+        Both waits together are limited to ``ratelimits.max_wait``, :exc:`RateLimited` is raised past that."""
+        deadline = time.monotonic() + self.ratelimits.max_wait
+
+        try:
+            await self.lanes.acquire(priority, self.ratelimits.max_wait)
+        except asyncio.TimeoutError:
+            LOG.warning("No %s request slot for %s within %.2f seconds", priority, host, self.ratelimits.max_wait)
+            raise RateLimited(host, self.ratelimits.retry_after(host)) from None
+
+        try:
+            await self._wait_for_slot(host, priority, max(deadline - time.monotonic(), 0))
+        except BaseException:
+            self.lanes.release(priority)
+            raise
+        finally:
+            self.lanes.ready(priority)
+
+    async def _wait_for_slot(self, host, priority="interactive", max_wait=None):
+        if priority == "background":
+            # only take tokens that are free right now, never queue up in front of interactive requests
+            bucket = self.ratelimits.bucket(host)
+            while bucket.delay() > 0 or not self.lanes.idle.is_set():
+                await asyncio.sleep(bucket.delay())
+                await self.lanes.idle.wait()
+
+        delay = self.ratelimits.reserve(host, max_wait)
+
+        if delay is None:
+            raise RateLimited(host, self.ratelimits.retry_after(host))
+
+        if delay:
+            LOG.debug("Waiting %.2f seconds for a %s rate limit slot", delay, host)
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self.ratelimits.bucket(host).refund()
+                raise
+
+    async def _handle_response(self, r, info, retry_after, started):
+        request_fmt = f"{r.status} {r.method} {r.url}"
+        entry = info.entry
+
+        if r.status == 304 and entry is not None:
+            self.stats.observe(r.url, r.status, time.perf_counter() - started)
+            self.stats.count(info.host, "revalidated")
+
+            ttl = self._ttl(r, info.cache)
+            if ttl is None:
+                # the server doesn't want it cached anymore
+                self.cache.pop(info.key)
+                LOG.info("%s revalidated cache entry, evicted as it's no longer cacheable", request_fmt)
+            else:
+                entry.refresh(ttl)
+                self._store(info.key, entry)
+                LOG.info("%s revalidated cache entry", request_fmt)
+
+            return entry.data
+
+        body = await r.read()
+        content_type = r.headers.get("Content-Type", "")
+        elapsed = time.perf_counter() - started
+        self.stats.observe(r.url, r.status, elapsed, len(body))
+        self.body_log(r, body, elapsed)
+
+        if "application/json" in content_type and len(body) > self.offload_threshold:
+            data = await self.loop.run_in_executor(self.executor, decode_body, body, content_type)
+        else:
+            data = decode_body(body, content_type)
+
+        if 300 > r.status >= 200:
+            LOG.info("%s succeeded", request_fmt)
+
+            if callable(info.negative) and info.negative(data):
+                self.negative.put(info.key, CacheEntry(r.url, data, len(body), self.negative.default_ttl))
+                LOG.debug("%s Inserted empty result into negative cache", request_fmt)
+            elif info.cache:
+                ttl = self._ttl(r, info.cache)
+                if ttl is not None:
+                    self._store(info.key, CacheEntry(r.url, data, len(body), ttl, etag=r.headers.get("ETag"),
+                                                     last_modified=r.headers.get("Last-Modified")))
+                    LOG.debug("%s Inserted data into cache for %s seconds", request_fmt, ttl)
+            return data
+
+        if r.status == 429:
+            LOG.warning("%s RATE LIMITED", request_fmt)
+            raise RateLimited(info.host, retry_after or 0.0, r, data)
+
+        if r.status in {500, 502}:
+            LOG.warning("%s INTERNAL ERROR", request_fmt)
+            raise WebException(r, data)
+
+        if info.negative and r.status in {404, 410}:
+            self.negative.put(info.key, CacheEntry(r.url, CachedResponse(r, data), len(body),
+                                                   self.negative.default_ttl))
+            LOG.debug("%s Inserted response into negative cache", request_fmt)
+
+        LOG.error("%s errored.", request_fmt)
+        raise WebException(r, data)
+
+    def _store(self, key, entry):
+        self.cache.put(key, entry)
+
+        if self.l2 is not None:
+            self.loop.create_task(self.l2.put(key, entry))
+
+    def _ttl(self, response, cache):
+        # an explicit amount of seconds always wins over what the server says
+        if cache is not True and cache != "swr":
+            return cache
+
+        return parse_ttl(response.headers, self.cache.default_ttl)
+
+    def restore_snapshot(self):
+        started = time.perf_counter()
+
+        try:
+            count = self.snapshot.load(self.cache)
+        except (OSError, ValueError, struct.error) as exc:
+            LOG.warning("Failed to restore cache snapshot [%s: %s]", type(exc).__name__, exc)
+            return 0
+
+        LOG.info("Restored %s cache entries from %s in %.2fms",
+                 count, self.snapshot.path, (time.perf_counter() - started) * 1000)
+        return count
+
+    async def save_snapshot(self):
+        # the entries are copied here, serializing and writing them happens in a thread
+        items = self.cache.items()
+
+        async with self._snapshot_lock:
+            future = self.loop.run_in_executor(self.executor, self.snapshot.save, items)
+
+            try:
+                count = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # the thread keeps writing, hold the lock until it's done
+                await asyncio.wait([future])
+                raise
+            except Exception as exc:
+                LOG.warning("Failed to save cache snapshot [%s: %s]", type(exc).__name__, exc)
+                return 0
+
+        LOG.info("Saved %s cache entries to %s", count, self.snapshot.path)
+        return count
+
+    async def _snapshot_loop(self):
+        interval = self.config.get("cache", {}).get("snapshot", {}).get("interval", 300)
+
+        while True:
+            await asyncio.sleep(interval)
+            await self.save_snapshot()
+
     async def close(self):
+        try:
+            if self._snapshot_task is not None:
+                self._snapshot_task.cancel()
+                try:
+                    await self._snapshot_task
+                except asyncio.CancelledError:
+                    pass
+
+            if self.snapshot is not None:
+                await self.save_snapshot()
+        finally:
+            for session in {self.session, *self.sessions.values()}:
+                await session.close()
+
+            self.executor.shutdown(wait=False)
+
         LOG.info("Session closed.")
-        await self.session.close()
@@ -0,0 +1,390 @@
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import time
+import zlib
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+
+import aioredis
+from yarl import URL
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+LOG = logging.getLogger("utils.httpcache")
+
+MAX_AGE_REGEX = re.compile(r"(?:s-maxage|max-age)=(\d+)")
+
+
+def parse_ttl(headers, default):
+    """Get how long a response can be cached for from its headers.
+
+    Returns ``None`` if the response must not be stored at all."""
+    control = headers.get("Cache-Control", "").lower()
+
+    if "no-store" in control:
+        return None
+    if "no-cache" in control:
+        return 0
+
+    match = MAX_AGE_REGEX.search(control)
+    if match:
+        return int(match.group(1))
+
+    expires = headers.get("Expires")
+    if expires:
+        try:
+            return max(parsedate_to_datetime(expires).timestamp() - time.time(), 0)
+        except (TypeError, ValueError):
+            return 0
+
+    return default
+
+
+class CacheEntry:
+    __slots__ = ("url", "host", "data", "size", "expires", "etag", "last_modified")
+
+    def __init__(self, url, data, size, ttl, *, etag=None, last_modified=None):
+        self.url = str(url)
+        self.host = URL(self.url).host
+        self.data = data
+        self.size = size
+        self.expires = time.time() + ttl
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @classmethod
+    def from_parts(cls, url, data, size, expires, etag, last_modified):
+        self = cls(url, data, size, 0, etag=etag, last_modified=last_modified)
+        self.expires = expires
+
+        return self
+
+    def to_parts(self):
+        return [self.url, self.data, self.size, self.expires, self.etag, self.last_modified]
+
+    @property
+    def expired(self):
+        return time.time() >= self.expires
+
+    @property
+    def revalidatable(self):
+        return bool(self.etag or self.last_modified)
+
+    def refresh(self, ttl):
+        self.expires = time.time() + ttl
+
+    def conditional_headers(self):
+        headers = {}
+
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+
+        return headers
+
+    def __repr__(self):
+        return f"<CacheEntry url={self.url!r} size={self.size} expired={self.expired}>"
+
+
+def dump_entry(entry):
+    """Serialize and compress an entry, with msgpack if it's installed and JSON otherwise.
+
+    Returns ``None`` for binary bodies when msgpack is not installed."""
+    if msgpack is not None:
+        return b"m" + zlib.compress(msgpack.packb(entry.to_parts(), use_bin_type=True))
+
+    if isinstance(entry.data, bytes):
+        return None
+
+    return b"j" + zlib.compress(json.dumps(entry.to_parts()).encode())
+
+
+def load_entry(raw):
+    kind, payload = raw[:1], zlib.decompress(raw[1:])
+
+    if kind == b"m":
+        return CacheEntry.from_parts(*msgpack.unpackb(payload, raw=False))
+
+    return CacheEntry.from_parts(*json.loads(payload))
+
+
+class ResponseCache:
+    """An LRU cache bounded by the total size of its entries, in bytes.
+
+    Expired entries are kept around, until evicted, so they can be revalidated
+    or served while being refreshed, up to ``max_stale`` seconds after expiring."""
+    __slots__ = ("max_bytes", "default_ttl", "max_stale", "size", "hits", "stale", "misses", "evictions",
+                 "_entries")
+
+    def __init__(self, max_bytes, default_ttl, max_stale=86400):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.max_stale = max_stale
+
+        self.size = 0
+        self.hits = 0
+        # lookups that found an expired entry, to revalidate or serve while refreshing
+        self.stale = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        try:
+            entry = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        if entry.expired:
+            self.stale += 1
+        else:
+            self.hits += 1
+
+        return entry
+
+    def put(self, key, entry):
+        self.pop(key)
+
+        if entry.size > self.max_bytes:
+            return False
+
+        self._entries[key] = entry
+        self.size += entry.size
+        self._shrink()
+
+        return True
+
+    def pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+
+        return entry
+
+    def purge(self, *, host=None, prefix=None):
+        if host is None and prefix is None:
+            count = len(self._entries)
+            self._entries.clear()
+            self.size = 0
+            return count
+
+        keys = [k for k, e in self._entries.items()
+                if (host is None or e.host == host) and (prefix is None or e.url.startswith(prefix))]
+
+        for key in keys:
+            self.pop(key)
+
+        return len(keys)
+
+    def resize(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._shrink()
+
+    def _shrink(self):
+        while self.size > self.max_bytes:
+            _, entry = self._entries.popitem(last=False)
+            self.size -= entry.size
+            self.evictions += 1
+
+    def items(self):
+        """Return the ``(key, entry)`` pairs, least recently used first."""
+        return list(self._entries.items())
+
+    def stats(self):
+        expired = sum(1 for e in self._entries.values() if e.expired)
+
+        return {
+            "entries": len(self._entries),
+            "expired": expired,
+            "size": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "stale": self.stale,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+
+class RedisCacheTier:
+    """A second cache tier shared by every process using the same Redis.
+
+    Entries are stored compressed, with msgpack if it's installed and JSON otherwise
+    (in which case raw binary bodies are not stored at all).
+    Revalidatable entries are kept ``stale_ttl`` seconds after expiring."""
+    __slots__ = ("redis", "prefix", "max_entry_bytes", "stale_ttl", "hits", "misses", "skipped")
+
+    def __init__(self, redis, *, prefix="ezr-cache:", max_entry_bytes=512 * 1024, stale_ttl=3600):
+        self.redis = redis
+        self.prefix = prefix
+        self.max_entry_bytes = max_entry_bytes
+        self.stale_ttl = stale_ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+
+    def _key(self, key):
+        return self.prefix + key.hex()
+
+    async def get(self, key):
+        try:
+            raw = await self.redis.get(self._key(key), encoding=None)
+        except (aioredis.RedisError, OSError) as exc:
+            LOG.warning("Failed to fetch cache entry from Redis [%s: %s]", type(exc).__name__, exc)
+            return None
+
+        if raw is None:
+            self.misses += 1
+            return None
+
+        try:
+            entry = load_entry(raw)
+        except Exception as exc:
+            LOG.warning("Discarding malformed cache entry from Redis [%s: %s]", type(exc).__name__, exc)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return entry
+
+    async def put(self, key, entry):
+        raw = dump_entry(entry)
+
+        if raw is None or len(raw) > self.max_entry_bytes:
+            self.skipped += 1
+            return False
+
+        ttl = math.ceil(entry.expires - time.time()) + (self.stale_ttl if entry.revalidatable else 0)
+        if ttl <= 0:
+            return False
+
+        try:
+            await self.redis.set(self._key(key), raw, expire=ttl)
+        except (aioredis.RedisError, OSError) as exc:
+            LOG.warning("Failed to store cache entry in Redis [%s: %s]", type(exc).__name__, exc)
+            return False
+
+        return True
+
+    async def clear(self, batch=500):
+        """Delete every entry under :attr:`prefix`, returns how many were deleted.
+
+        Keys are hashed, so there's no way to only delete the ones of a host or URL prefix."""
+        count = 0
+        keys = []
+
+        try:
+            async for key in self.redis.iscan(match=f"{self.prefix}*", count=batch):
+                keys.append(key)
+
+                if len(keys) >= batch:
+                    count += await self.redis.delete(*keys)
+                    keys.clear()
+
+            if keys:
+                count += await self.redis.delete(*keys)
+        except (aioredis.RedisError, OSError) as exc:
+            LOG.warning("Failed to clear the Redis cache tier [%s: %s]", type(exc).__name__, exc)
+
+        return count
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "skipped": self.skipped}
+
+
+class CacheSnapshot:
+    """Saves a :class:`ResponseCache` to a file and restores it.
+
+    The file is a header, a fixed size index of ``(key, offset, length, expires)``
+    and then the serialized entries. It's memory mapped when loading,
+    so entries too old to be used are skipped without being read at all."""
+    __slots__ = ("path",)
+
+    MAGIC = b"EZRC"
+    VERSION = 1
+    HEADER = struct.Struct("<4sBI")
+    INDEX = struct.Struct("<16sQId")
+
+    def __init__(self, path):
+        self.path = path
+
+    def save(self, items):
+        """Write ``(key, entry)`` pairs, least recently used first, returns how many were written."""
+        index = []
+        blobs = []
+        offset = 0
+
+        for key, entry in items:
+            raw = dump_entry(entry) if len(key) == 16 else None
+            if raw is None:
+                continue
+
+            index.append(self.INDEX.pack(key, offset, len(raw), entry.expires))
+            blobs.append(raw)
+            offset += len(raw)
+
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "wb") as fp:
+            fp.write(self.HEADER.pack(self.MAGIC, self.VERSION, len(index)))
+            fp.writelines(index)
+            fp.writelines(blobs)
+
+        # atomic, a crash while writing never leaves a truncated snapshot behind
+        os.replace(tmp, self.path)
+
+        return len(index)
+
+    def load(self, cache):
+        """Put the entries that can still be used (fresh or within ``max_stale``) into ``cache``.
+
+        Returns how many were restored."""
+        try:
+            fp = open(self.path, "rb")
+        except FileNotFoundError:
+            return 0
+
+        with fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            magic, version, count = self.HEADER.unpack_from(mm)
+            if magic != self.MAGIC or version != self.VERSION:
+                LOG.warning("Ignoring cache snapshot %s with unknown format", self.path)
+                return 0
+
+            base = self.HEADER.size + self.INDEX.size * count
+            cutoff = time.time() - cache.max_stale
+            restored = 0
+
+            for key, offset, length, expires in self.INDEX.iter_unpack(mm[self.HEADER.size:base]):
+                if expires < cutoff:
+                    continue
+
+                try:
+                    entry = load_entry(mm[base + offset:base + offset + length])
+                except Exception as exc:
+                    LOG.warning("Skipping malformed snapshot entry [%s: %s]", type(exc).__name__, exc)
+                    continue
+
+                restored += cache.put(key, entry)
+
+        return restored
@@ -0,0 +1,160 @@
+import bisect
+import re
+from collections import Counter
+
+from yarl import URL
+
+ID_REGEX = re.compile(r"/(?:\d+|[0-9a-f]{16,})(?=/|$)", re.IGNORECASE)
+
+
+def fmt_labels(**labels):
+    """Format Prometheus labels, escaping their values as the text exposition format requires."""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+    return ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped))
+
+
+class Histogram:
+    """A fixed bucket histogram, like Prometheus' ones."""
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    # milliseconds
+    DEFAULT_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Get the upper bound of the bucket the ``q`` quantile falls in."""
+        if not self.count:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+
+        return float("inf")
+
+    def cumulative(self):
+        total = 0
+
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            yield bound, total
+
+
+class RouteStats:
+    __slots__ = ("latency", "statuses", "bytes")
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.statuses = Counter()
+        self.bytes = 0
+
+    @property
+    def errors(self):
+        return sum(c for s, c in self.statuses.items() if s == "error" or s >= 400)
+
+
+class HTTPStats:
+    """Latency, status codes and cache counters for outgoing requests, per host and route."""
+    __slots__ = ("max_routes", "routes", "cache")
+
+    def __init__(self, max_routes=32):
+        self.max_routes = max_routes
+
+        # {host: {route: RouteStats}}
+        self.routes = {}
+        # {(host, event): count}
+        self.cache = Counter()
+
+    def route_for(self, url):
+        url = URL(str(url))
+        routes = self.routes.setdefault(url.host, {})
+        route = ID_REGEX.sub("/:id", url.path)
+
+        # keep the amount of routes per host bounded, query based APIs make up paths on the fly
+        if route not in routes and len(routes) >= self.max_routes:
+            route = ":other"
+
+        try:
+            return routes[route]
+        except KeyError:
+            routes[route] = ret = RouteStats()
+            return ret
+
+    def observe(self, url, status, elapsed, size=0):
+        stats = self.route_for(url)
+
+        stats.latency.observe(elapsed * 1000)
+        stats.statuses[status] += 1
+        stats.bytes += size
+
+    def count(self, host, event):
+        self.cache[(host, event)] += 1
+
+    def hosts(self):
+        """Yield every host with the stats of all its routes merged."""
+        for host, routes in sorted(self.routes.items()):
+            merged = RouteStats()
+
+            for stats in routes.values():
+                merged.latency.counts = [a + b for a, b in zip(merged.latency.counts, stats.latency.counts)]
+                merged.latency.count += stats.latency.count
+                merged.latency.sum += stats.latency.sum
+                merged.statuses.update(stats.statuses)
+                merged.bytes += stats.bytes
+
+            yield host, merged
+
+    def to_prometheus(self):
+        lines = [
+            "# HELP takuru_http_request_duration_ms Outgoing HTTP request latency.",
+            "# TYPE takuru_http_request_duration_ms histogram",
+        ]
+
+        for host, routes in sorted(self.routes.items()):
+            for route, stats in sorted(routes.items()):
+                labels = fmt_labels(host=host, route=route)
+
+                for bound, total in stats.latency.cumulative():
+                    le = "+Inf" if bound == float("inf") else bound
+                    lines.append(f'takuru_http_request_duration_ms_bucket{{{labels},le="{le}"}} {total}')
+
+                lines.append(f"takuru_http_request_duration_ms_sum{{{labels}}} {stats.latency.sum}")
+                lines.append(f"takuru_http_request_duration_ms_count{{{labels}}} {stats.latency.count}")
+
+        lines.append("# HELP takuru_http_responses_total Outgoing HTTP responses by status code.")
+        lines.append("# TYPE takuru_http_responses_total counter")
+
+        for host, routes in sorted(self.routes.items()):
+            for route, stats in sorted(routes.items()):
+                for status, count in sorted(stats.statuses.items(), key=lambda t: str(t[0])):
+                    labels = fmt_labels(host=host, route=route, status=status)
+                    lines.append(f"takuru_http_responses_total{{{labels}}} {count}")
+
+        lines.append("# HELP takuru_http_received_bytes_total Bytes received from outgoing HTTP requests.")
+        lines.append("# TYPE takuru_http_received_bytes_total counter")
+
+        for host, routes in sorted(self.routes.items()):
+            for route, stats in sorted(routes.items()):
+                lines.append(f"takuru_http_received_bytes_total{{{fmt_labels(host=host, route=route)}}} {stats.bytes}")
+
+        lines.append("# HELP takuru_http_cache_events_total Response cache hits, misses, coalesced waits and hedges.")
+        lines.append("# TYPE takuru_http_cache_events_total counter")
+
+        for (host, event), count in sorted(self.cache.items()):
+            lines.append(f"takuru_http_cache_events_total{{{fmt_labels(host=host, event=event)}}} {count}")
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,56 @@
+import asyncio
+
+
+class PriorityLanes:
+    """Separate concurrency budgets for interactive (command) and background requests.
+
+    Background requests also hold off while interactive ones are queued, so they only ever use spare capacity."""
+    __slots__ = ("limits", "semaphores", "active", "queued", "idle")
+
+    LANES = ("interactive", "background")
+
+    def __init__(self, config):
+        self.limits = {"interactive": config.get("interactive", 32), "background": config.get("background", 4)}
+        self.semaphores = {lane: asyncio.Semaphore(limit) for lane, limit in self.limits.items()}
+        self.active = dict.fromkeys(self.LANES, 0)
+
+        # interactive requests waiting for a concurrency or rate limit slot
+        self.queued = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    async def acquire(self, lane, timeout=None):
+        """Wait for a slot in ``lane``, raises :exc:`asyncio.TimeoutError` if none frees up within ``timeout``."""
+        if lane not in self.semaphores:
+            raise ValueError(f"Unknown priority {lane!r}, expected one of {', '.join(self.LANES)}")
+
+        if lane == "background":
+            await self.idle.wait()
+        else:
+            self.queued += 1
+            self.idle.clear()
+
+        try:
+            await asyncio.wait_for(self.semaphores[lane].acquire(), timeout)
+        except BaseException:
+            self.ready(lane)
+            raise
+
+        self.active[lane] += 1
+
+    def ready(self, lane):
+        """Mark an interactive request as about to be sent, which lets background ones through again."""
+        if lane == "background":
+            return
+
+        self.queued -= 1
+        if not self.queued:
+            self.idle.set()
+
+    def release(self, lane):
+        self.active[lane] -= 1
+        self.semaphores[lane].release()
+
+    def stats(self):
+        """Map each lane to its active requests and limit."""
+        return {lane: (self.active[lane], self.limits[lane]) for lane in self.LANES}
@@ -0,0 +1,83 @@
+import gzip
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+
+DEFAULT_LEVELS = {
+    "takuru": "DEBUG",
+    "utils.ezrequests": "DEBUG",
+    "utils.httpcache": "INFO",
+    "utils.replay": "INFO",
+    "utils.timers": "DEBUG",
+    "utils.looplag": "INFO",
+    "cogs.nsfw": "DEBUG",
+    "cogs.moderator": "DEBUG",
+    "cogs.reminders": "INFO",
+}
+
+FORMAT = logging.Formatter("{asctime} | {levelname: <8} | {module}:{funcName}:{lineno} - {message}",
+                           datefmt="%Y-%m-%d %H:%M:%S", style="{")
+
+
+def gzip_namer(name):
+    return name + ".gz"
+
+
+def gzip_rotator(source, dest):
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+
+    os.remove(source)
+
+
+def make_file_handler(config):
+    """A rotating file handler that gzips rotated files.
+
+    Rotates every ``when`` (see :class:`logging.handlers.TimedRotatingFileHandler`) if set,
+    otherwise once the file is bigger than ``max_bytes``."""
+    path = config.get("path", "pokecom/takuru.log")
+    backups = config.get("backup_count", 10)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    if config.get("when"):
+        handler = logging.handlers.TimedRotatingFileHandler(path, when=config["when"], backupCount=backups,
+                                                            encoding="utf-8", utc=True)
+    else:
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=config.get("max_bytes", 16 * 1024 * 1024),
+                                                       backupCount=backups, encoding="utf-8")
+
+    handler.namer = gzip_namer
+    handler.rotator = gzip_rotator
+
+    return handler
+
+
+def setup_logging(config):
+    """Route the configured loggers through a queue, handlers run in a :class:`logging.handlers.QueueListener` thread.
+
+    ``config`` is the ``logging`` section of the config, ``levels`` maps logger names to levels.
+    Returns the listener, which has to be stopped on shutdown to flush what's left in the queue."""
+    handlers = [make_file_handler(config)]
+    if config.get("console", True):
+        handlers.append(logging.StreamHandler())
+
+    for handler in handlers:
+        handler.setFormatter(FORMAT)
+
+    log_queue = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+
+    for name, level in {**DEFAULT_LEVELS, **config.get("levels", {})}.items():
+        logger = logging.getLogger(name)
+        logger.setLevel(level.upper() if isinstance(level, str) else level)
+        logger.handlers = [queue_handler]
+        logger.propagate = False
+
+    listener.start()
+    return listener
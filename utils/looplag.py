@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from .httpstats import Histogram
+
+LOG = logging.getLogger("utils.looplag")
+
+try:
+    current_task = asyncio.current_task
+except AttributeError:  # 3.6
+    current_task = asyncio.Task.current_task
+
+
+class Stall:
+    __slots__ = ("started_at", "duration", "task", "stack")
+
+    def __init__(self, started_at, task, stack):
+        self.started_at = started_at
+        # updated once the loop gets going again
+        self.duration = None
+        self.task = task
+        self.stack = stack
+
+
+class LoopLagMonitor:
+    """A cheap replacement for asyncio's debug mode.
+
+    A task sleeps for ``interval`` seconds in a loop and records how late it wakes up.
+    A watchdog thread notices when that task didn't run for longer than ``threshold`` seconds,
+    and captures the stack of the event loop thread and the task that was running while it's still blocked."""
+    __slots__ = ("loop", "interval", "threshold", "histogram", "recent", "stalls", "_beat", "_ident", "_stall",
+                 "_task", "_thread", "_stop")
+
+    def __init__(self, loop, *, interval=0.25, threshold=0.5, window=300, max_stalls=10):
+        self.loop = loop
+        self.interval = interval
+        self.threshold = threshold
+
+        # milliseconds, since start and over the last ``window`` seconds
+        self.histogram = Histogram((1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000))
+        self.recent = deque(maxlen=int(window / interval))
+        self.stalls = deque(maxlen=max_stalls)
+
+        self._beat = time.monotonic()
+        self._ident = None
+        self._stall = None
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Start sampling, has to be called from the event loop's thread."""
+        self._ident = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = self.loop.create_task(self._sample())
+
+        self._thread = threading.Thread(target=self._watch, name="looplag-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _sample(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+            now = time.monotonic()
+            lag = (now - start - self.interval) * 1000
+            self._beat = now
+
+            self.histogram.observe(lag)
+            self.recent.append(lag)
+
+            stall, self._stall = self._stall, None
+            if stall is not None:
+                stall.duration = lag / 1000
+                LOG.warning("Event loop was blocked for %.3f seconds while running %s\n%s",
+                            stall.duration, stall.task, "".join(stall.stack))
+
+    def _watch(self):
+        while not self._stop.wait(self.threshold / 2):
+            blocked = time.monotonic() - self._beat - self.interval
+            if blocked < self.threshold or self._stall is not None:
+                continue
+
+            frame = sys._current_frames().get(self._ident)
+            stack = traceback.format_stack(frame) if frame is not None else []
+
+            try:
+                task = repr(current_task(self.loop))
+            except RuntimeError:
+                task = None
+
+            self._stall = stall = Stall(time.time() - blocked, task, stack)
+            self.stalls.append(stall)
+
+    def quantile(self, q):
+        """Get the ``q`` quantile of the lag over the last ``window`` seconds, in milliseconds."""
+        if not self.recent:
+            return 0.0
+
+        values = sorted(self.recent)
+        return values[min(int(q * len(values)), len(values) - 1)]
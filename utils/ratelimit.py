@@ -0,0 +1,132 @@
+import time
+from email.utils import parsedate_to_datetime
+
+
+def parse_retry_after(value):
+    """Parse a ``Retry-After`` header, which is either an amount of seconds or an HTTP date."""
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """A token bucket that hands out reservations.
+
+    Tokens can go negative, each reservation made while the bucket is empty
+    has to wait a bit longer than the previous one, which makes waiters FIFO without a lock."""
+    __slots__ = ("rate", "per", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate, per):
+        self.rate = rate
+        self.per = per
+
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.per)
+        self.updated = now
+
+    def delay(self, now=None):
+        """How long a new reservation would have to wait."""
+        now = now or time.monotonic()
+        self._refill(now)
+
+        return max(self.blocked_until - now, (1 - self.tokens) * self.per / self.rate, 0.0)
+
+    def reserve(self, now=None):
+        delay = self.delay(now)
+        self.tokens -= 1
+
+        return delay
+
+    def refund(self):
+        self.tokens += 1
+
+    def block(self, seconds):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = min(self.tokens, 0)
+
+
+class HostRateLimiter:
+    """Per host token buckets, configured from ``http.ratelimits`` and tuned by the rate limit headers."""
+    __slots__ = ("max_wait", "default", "overrides", "buckets")
+
+    def __init__(self, config):
+        self.max_wait = config.get("max_wait", 10.0)
+        self.default = config.get("default", {"rate": 10, "per": 1.0})
+        self.overrides = config.get("hosts", {})
+
+        self.buckets = {}
+
+    def bucket(self, host):
+        try:
+            return self.buckets[host]
+        except KeyError:
+            conf = self.overrides.get(host, self.default)
+            self.buckets[host] = ret = TokenBucket(conf["rate"], conf["per"])
+
+            return ret
+
+    def reserve(self, host, max_wait=None):
+        """Reserve a slot for ``host``.
+
+        Returns how long to wait before sending the request,
+        or ``None`` if that would be longer than ``max_wait`` (defaulting to the configured one)."""
+        bucket = self.bucket(host)
+        delay = bucket.reserve()
+
+        if delay > (self.max_wait if max_wait is None else max_wait):
+            bucket.refund()
+            return None
+
+        return delay
+
+    def retry_after(self, host):
+        return self.bucket(host).delay()
+
+    def update(self, host, status, headers):
+        """Learn from a response's headers, returns the ``Retry-After`` if there was one."""
+        bucket = self.bucket(host)
+        retry_after = None
+
+        if "Retry-After" in headers:
+            retry_after = parse_retry_after(headers["Retry-After"])
+
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset = headers.get("X-RateLimit-Reset")
+
+        try:
+            remaining = float(remaining)
+        except (TypeError, ValueError):
+            pass
+        else:
+            bucket.tokens = min(bucket.tokens, remaining)
+
+            if remaining < 1 and reset is not None and retry_after is None:
+                try:
+                    reset = float(reset)
+                except ValueError:
+                    pass
+                else:
+                    # some APIs send a unix timestamp, some the amount of seconds left
+                    retry_after = max(reset - time.time(), 0.0) if reset > 1e9 else reset
+
+        if retry_after is None and status == 429:
+            retry_after = bucket.per / bucket.rate
+
+        if retry_after is not None:
+            bucket.block(retry_after)
+
+        return retry_after
+
+    def stats(self):
+        """Map each host to the tokens left in its bucket and how long a new request would wait."""
+        return {host: (bucket.tokens, bucket.delay()) for host, bucket in self.buckets.items()}
@@ -0,0 +1,259 @@
+import abc
+import base64
+import hashlib
+import logging
+import os
+
+import aiohttp
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+LOG = logging.getLogger("utils.replay")
+
+
+class MissingFixture(aiohttp.ClientError):
+    __slots__ = ("key",)
+
+    def __init__(self, key):
+        self.key = key
+
+        super().__init__(f"No recorded response for {key}")
+
+
+def fixture_key(method, url, params=None, *, json_body=None, data=None):
+    """Build the key a request is recorded under.
+
+    It's readable on purpose, so fixture files can be edited by hand:
+    ``GET https://example.com/path?a=1&b=2``, with a short digest of the body appended if there's one."""
+    url = URL(str(url))
+    query = {**url.query, **{k: str(v) for k, v in (params or {}).items()}}
+    key = f"{method.upper()} {url.with_query(sorted(query.items()))}"
+
+    if json_body is not None:
+        body = json.dumps(json_body, sort_keys=True).encode()
+    elif isinstance(data, dict):
+        body = "&".join(f"{k}={v}" for k, v in sorted(data.items())).encode()
+    elif isinstance(data, str):
+        body = data.encode()
+    else:
+        body = data
+
+    if body:
+        key += " #" + hashlib.blake2b(body, digest_size=6).hexdigest()
+
+    return key
+
+
+class Recording:
+    """Request/response pairs, loaded from and saved to a JSON fixture file."""
+    __slots__ = ("path", "responses", "dirty", "_bodies")
+
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.responses = {}
+        self.dirty = False
+        # decoded bodies, so replaying doesn't pay for base64 every time
+        self._bodies = {}
+
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as fp:
+                self.responses = json.load(fp)["responses"]
+
+            LOG.info("Loaded %s recorded responses from %s", len(self.responses), path)
+
+    def add(self, key, method, url, status, headers, body):
+        """Record a response, ``body`` is bytes and ``headers`` a mapping or a list of pairs."""
+        entry = {"method": method, "url": str(url), "status": status,
+                 "headers": list(headers.items() if hasattr(headers, "items") else headers)}
+
+        try:
+            entry["body"] = body.decode("utf-8")
+        except UnicodeDecodeError:
+            entry["body_b64"] = base64.b64encode(body).decode("ascii")
+
+        self.responses[key] = entry
+        self._bodies[key] = body
+        self.dirty = True
+
+    def get(self, key):
+        try:
+            entry = self.responses[key]
+        except KeyError:
+            raise MissingFixture(key) from None
+
+        try:
+            body = self._bodies[key]
+        except KeyError:
+            if "body_b64" in entry:
+                body = base64.b64decode(entry["body_b64"])
+            else:
+                body = entry["body"].encode("utf-8")
+
+            self._bodies[key] = body
+
+        return ReplayResponse(entry["method"], URL(entry["url"]), entry["status"], entry["headers"], body)
+
+    def save(self):
+        if not self.dirty:
+            return
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with open(self.path, "w", encoding="utf-8") as fp:
+            json.dump({"version": self.VERSION, "responses": self.responses}, fp)
+
+        self.dirty = False
+        LOG.info("Saved %s recorded responses to %s", len(self.responses), self.path)
+
+
+class ReplayStream:
+    __slots__ = ("_body",)
+
+    def __init__(self, body):
+        self._body = body
+
+    async def iter_chunked(self, n):
+        for i in range(0, len(self._body), n):
+            yield self._body[i:i + n]
+
+    async def read(self, n=-1):
+        if n < 0:
+            n = len(self._body)
+
+        chunk, self._body = self._body[:n], self._body[n:]
+        return chunk
+
+
+class ReplayResponse:
+    """The bits of :class:`aiohttp.ClientResponse` :class:`EasyRequests` uses."""
+    __slots__ = ("method", "url", "status", "headers", "content", "_body")
+
+    def __init__(self, method, url, status, headers, body):
+        self.method = method
+        self.url = url
+        self.status = status
+        self.headers = CIMultiDictProxy(CIMultiDict(headers))
+        self.content = ReplayStream(body)
+        self._body = body
+
+    @property
+    def content_length(self):
+        return len(self._body)
+
+    async def read(self):
+        return self._body
+
+    async def text(self, encoding="utf-8"):
+        return self._body.decode(encoding)
+
+    async def json(self, *, loads=json.loads, **_):
+        return loads(self._body)
+
+    def release(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+
+class _RequestContextManager:
+    # like aiohttp's, can be either awaited or used with async with
+    __slots__ = ("_coro", "_resp")
+
+    def __init__(self, coro):
+        self._coro = coro
+        self._resp = None
+
+    def __await__(self):
+        return self._coro.__await__()
+
+    async def __aenter__(self):
+        self._resp = await self._coro
+        return self._resp
+
+    async def __aexit__(self, *exc):
+        self._resp.release()
+
+
+class _FakeSession(abc.ABC):
+    """The parts of :class:`aiohttp.ClientSession` :class:`EasyRequests` uses, on top of :meth:`_request`."""
+    __slots__ = ("recording", "closed")
+
+    def __init__(self, recording):
+        self.recording = recording
+        self.closed = False
+
+    def request(self, method, url, *, params=None, **kwargs):
+        return _RequestContextManager(self._request(method, url, params, **kwargs))
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request("HEAD", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    @abc.abstractmethod
+    async def _request(self, method, url, params, **kwargs):
+        """Return a :class:`ReplayResponse` for the request."""
+
+
+class ReplaySession(_FakeSession):
+    """Answers requests from a :class:`Recording`, without touching the network.
+
+    Raises :exc:`MissingFixture` for requests that weren't recorded."""
+    __slots__ = ()
+
+    async def _request(self, method, url, params, *, json=None, data=None, **_):
+        return self.recording.get(fixture_key(method, url, params, json_body=json, data=data))
+
+    async def close(self):
+        self.closed = True
+
+
+class RecordingSession(_FakeSession):
+    """Makes requests through a real session and records them in a :class:`Recording`.
+
+    The recording is saved when the session is closed."""
+    __slots__ = ("session",)
+
+    def __init__(self, recording, session):
+        super().__init__(recording)
+        self.session = session
+
+    async def _request(self, method, url, params, **kwargs):
+        key = fixture_key(method, url, params, json_body=kwargs.get("json"), data=kwargs.get("data"))
+
+        async with self.session.request(method, url, params=params, **kwargs) as r:
+            body = await r.read()
+
+            self.recording.add(key, r.method, r.url, r.status, r.headers, body)
+            LOG.debug("Recorded %s (%s, %s bytes)", key, r.status, len(body))
+
+            return ReplayResponse(r.method, r.url, r.status, r.headers, body)
+
+    @classmethod
+    def wrap(cls, recording, session, sessions):
+        """Wrap the default session and the ``{host: session}`` mapping of :class:`EasyRequests`."""
+        wrapped = {s: cls(recording, s) for s in {session, *sessions.values()}}
+
+        return wrapped[session], {host: wrapped[s] for host, s in sessions.items()}
+
+    async def close(self):
+        await self.session.close()
+        self.recording.save()
+        self.closed = True
@@ -1,93 +1,431 @@
+import asyncio
 import hashlib
+import heapq
 import logging
+import time
+from collections import defaultdict, deque
 
 import aioredis
 from discord.ext import commands, tasks
 
+from .httpstats import Histogram
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
 LOG = logging.getLogger("utils.timers")
 
+# atomically take a timer if it's due, so it's dispatched exactly once even with several processes
+# KEYS are the sorted set, the data hash and the timer's indexes
+CLAIM_SCRIPT = """
+local score = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if not score or tonumber(score) > tonumber(ARGV[2]) then
+    return false
+end
+
+local data = redis.call('HGET', KEYS[2], ARGV[1])
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[2], ARGV[1])
+for i = 3, #KEYS do
+    redis.call('ZREM', KEYS[i], ARGV[1])
+end
+
+return data
+"""
+
+# same as above for several timers, returns the ids, data and due time of the ones claimed
+# ARGV is the current time, then every timer's id and the positions in KEYS of its indexes, comma separated
+CLAIM_DUE_SCRIPT = """
+local ret = {}
+
+for i = 2, #ARGV, 2 do
+    local id = ARGV[i]
+    local score = redis.call('ZSCORE', KEYS[1], id)
+
+    if score and tonumber(score) <= tonumber(ARGV[1]) then
+        local data = redis.call('HGET', KEYS[2], id)
+        redis.call('ZREM', KEYS[1], id)
+        redis.call('HDEL', KEYS[2], id)
+        for index in string.gmatch(ARGV[i + 1], '%d+') do
+            redis.call('ZREM', KEYS[tonumber(index)], id)
+        end
+
+        if data then
+            table.insert(ret, id)
+            table.insert(ret, data)
+            table.insert(ret, score)
+        end
+    end
+end
+
+return ret
+"""
+
+# a timer index with its timers' data, in one call
+LIST_SCRIPT = """
+local ids = redis.call('ZRANGE', KEYS[1], 0, -1, 'WITHSCORES')
+local ret = {}
+
+for i = 1, #ids, 2 do
+    local data = redis.call('HGET', KEYS[2], ids[i])
+    if data then
+        table.insert(ret, data)
+        table.insert(ret, ids[i + 1])
+    end
+end
+
+return ret
+"""
+
+
+class DispatchLag:
+    """How late timers of a name were dispatched, in milliseconds."""
+    __slots__ = ("histogram", "recent", "max")
+
+    BUCKETS = (10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 300000)
+
+    def __init__(self, window=256):
+        # since start, and the last ``window`` timers
+        self.histogram = Histogram(self.BUCKETS)
+        self.recent = deque(maxlen=window)
+        self.max = 0.0
+
+    def observe(self, lag):
+        self.histogram.observe(lag)
+        self.recent.append(lag)
+        self.max = max(self.max, lag)
+
+    def quantile(self, q):
+        """Get the ``q`` quantile of the last ``window`` lags."""
+        if not self.recent:
+            return 0.0
+
+        values = sorted(self.recent)
+        return values[min(int(q * len(values)), len(values) - 1)]
+
 
 class TimerManager(commands.Cog):
-    def __init__(self, bot):
+    """Timers stored in a Redis sorted set scored by due time, with the next few minutes of them in a heap.
+
+    Once a timer is due ``{name}_complete`` is dispatched with its kwargs.
+    Timers are also indexed per name and, if they have a ``guild_id`` kwarg, per name and guild.
+    Nothing relies on key expiration events, so timers that came due while the bot
+    (or its Redis connection) was down are dispatched on the next sweep instead of being lost.
+
+    Timers from the heap are claimed by ``workers`` tasks, how late each one was dispatched is kept in :attr:`lag`."""
+
+    DUE_KEY = "timers:due"
+    DATA_KEY = "timers:data"
+    INDEX_PREFIX = "timers:index:"
+
+    def __init__(self, bot, *, horizon=300, refill_interval=30, batch=100, workers=4):
         self.bot = bot
 
-        self.channel = None
+        # how far ahead timers are loaded into the heap, and how often that's done
+        self.horizon = horizon
+        self.refill_interval = refill_interval
+        self.batch = batch
 
-        db = self.bot.redis.db
-        self._channel_fmt = f"__keyevent@{db}__:expired"
+        self._heap = []
+        # {id: due}, what's in the heap and still valid
+        self._scheduled = {}
+        self._refill_at = 0.0
+        self._wakeup = asyncio.Event()
 
-        self.fetch_timers.add_exception_type(aioredis.ChannelClosedError)
-        self.fetch_timers.add_exception_type(aioredis.PoolClosedError)
-        self.fetch_timers.start()
+        # {name: DispatchLag}
+        self.lag = {}
+        # due timers waiting for a worker, bounded so a backlog stays in the heap
+        self.queue = asyncio.Queue(maxsize=workers * 4)
+        self._workers = [bot.loop.create_task(self._worker()) for _ in range(workers)]
+
+        self.dispatch_timers.add_exception_type(aioredis.ConnectionClosedError)
+        self.dispatch_timers.add_exception_type(aioredis.PoolClosedError)
+        self.dispatch_timers.start()
 
     @tasks.loop(reconnect=True)
-    async def fetch_timers(self):
-        key = await self.channel.get(encoding="utf-8")
+    async def dispatch_timers(self):
+        now = time.time()
 
-        if not key or not key.startswith("timer-"):
-            self.fetch_timers.restart()
+        if now >= self._refill_at:
+            await self._refill(now)
 
-        tr = self.bot.redis.multi_exec()
+        timeout = self._refill_at - now
+        if self._heap:
+            timeout = min(timeout, self._heap[0][0] - now)
 
-        tr.hgetall(f"lookup-{key}")
-        tr.delete(f"lookup-{key}")
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), max(timeout, 0))
+        except asyncio.TimeoutError:
+            pass
 
-        kwargs, _ = await tr.execute()
+        self._wakeup.clear()
+        await self._fire_due()
 
-        try:
-            name = kwargs.pop("name")
-        except KeyError:
-            LOG.warning("Timer with args %s doesn't have a name field, discarding.", kwargs)
-        else:
-            LOG.info("Dispatching timer %s with args %s. SHA256: %s", name, kwargs, key.split(":")[-1])
-            self.bot.dispatch(f"{name}_complete", kwargs)
-
-    @fetch_timers.before_loop
-    async def before_fetch_timers(self):
+    @dispatch_timers.before_loop
+    async def before_dispatch_timers(self):
         await self.bot.wait_until_ready()
+        await self._migrate_legacy()
+
+    async def _refill(self, now):
+        """Dispatch every overdue timer and load the ones due within ``horizon`` into the heap."""
+        redis = self.bot.redis
+
+        while True:
+            ids = await redis.zrangebyscore(self.DUE_KEY, float("-inf"), now, offset=0, count=self.batch)
+            if not ids:
+                break
+
+            keys, args = self._claim_args(ids)
+            claimed = await redis.eval(CLAIM_DUE_SCRIPT, keys=keys, args=[now, *args])
+
+            for id_, data, due in zip(claimed[::3], claimed[1::3], claimed[2::3]):
+                self._scheduled.pop(id_, None)
+                self._dispatch(id_, data, float(due))
+
+            # ids without data are claimed too, so this only stops once there's nothing left that's due
+            if len(ids) < self.batch:
+                break
+
+        upcoming = await redis.zrangebyscore(self.DUE_KEY, now, now + self.horizon, withscores=True)
+        for id_, due in upcoming:
+            self._schedule(id_, due)
 
-        self.channel = (await self.bot.redis.subscribe(self._channel_fmt))[0]
+        self._refill_at = now + self.refill_interval
 
-    @fetch_timers.after_loop
-    async def after_fetch_timers(self):
+    def _schedule(self, id_, due):
+        if self._scheduled.get(id_) == due:
+            return
+
+        self._scheduled[id_] = due
+        heapq.heappush(self._heap, (due, id_))
+
+        if self._heap[0][1] == id_:
+            self._wakeup.set()
+
+    async def _fire_due(self):
+        now = time.time()
+
+        while self._heap and self._heap[0][0] <= now:
+            due, id_ = heapq.heappop(self._heap)
+
+            # deleted or rescheduled since it was pushed
+            if self._scheduled.get(id_) != due:
+                continue
+            del self._scheduled[id_]
+
+            await self.queue.put((due, id_))
+
+    async def _worker(self):
+        while True:
+            due, id_ = await self.queue.get()
+
+            try:
+                data = await self.bot.redis.eval(CLAIM_SCRIPT, keys=[self.DUE_KEY, self.DATA_KEY, *self._indexes(id_)],
+                                                 args=[id_, time.time()])
+            except (aioredis.RedisError, OSError):
+                LOG.warning("Failed to claim timer %s", id_, exc_info=True)
+
+                # it's still in the sorted set, sweep right after reconnecting
+                self._refill_at = 0.0
+                self._wakeup.set()
+            else:
+                if data is not None:
+                    self._dispatch(id_, data, due)
+            finally:
+                self.queue.task_done()
+
+    def _dispatch(self, id_, data, due):
         try:
-            await self.bot.redis.unsubscribe(self._channel_fmt)
-        except (aioredis.PoolClosedError, RuntimeError, aioredis.ConnectionForcedCloseError,
-                aioredis.ChannelClosedError, aioredis.ConnectionClosedError):
-            pass
+            kwargs = json.loads(data)
+            name = kwargs.pop("name")
+        except (ValueError, KeyError, AttributeError):
+            LOG.warning("Discarding malformed timer %s: %r", id_, data)
+            return
+
+        lag = self.lag.get(name)
+        if lag is None:
+            lag = self.lag[name] = DispatchLag()
+        lag.observe(max(time.time() - due, 0) * 1000)
+
+        LOG.info("Dispatching timer %s with args %s. SHA256: %s", name, kwargs, id_.split(":")[-1])
+        self.bot.dispatch(f"{name}_complete", kwargs)
+
+    async def _migrate_legacy(self):
+        """Move timers made when they were expiring keys into the sorted set.
+
+        The ones whose key already expired are due right away."""
+        redis = self.bot.redis
+        now = time.time()
+        count = 0
+
+        async for key in redis.iscan(match="lookup-timer-*"):
+            old_id = key[len("lookup-timer-"):]
+            kwargs = await redis.hgetall(key)
+            ttl = await redis.ttl(f"timer-{old_id}")
+
+            name, _, h = old_id.partition(":")
+            id_ = self._make_id(name, h, kwargs)
+            due = now + max(ttl, 0)
+
+            tr = redis.multi_exec()
+            self._add(tr, id_, due, kwargs)
+            tr.delete(key, f"timer-{old_id}")
+            await tr.execute()
+
+            count += 1
+
+        if count:
+            LOG.info("Migrated %s legacy timers", count)
+
+    def _make_id(self, name, h, kwargs):
+        guild_id = kwargs.get("guild_id")
+        if guild_id is None:
+            return f"{name}:{h}"
+
+        return f"{name}:{guild_id}:{h}"
+
+    def _indexes(self, id_):
+        name, *guild_id, _ = id_.split(":")
+        if not guild_id:
+            return [self.INDEX_PREFIX + name]
+
+        return [self.INDEX_PREFIX + name, f"{self.INDEX_PREFIX}{name}:{guild_id[0]}"]
+
+    def _claim_args(self, ids):
+        """Get the ``KEYS`` and ``ARGV`` (but the current time) to claim ``ids`` with :data:`CLAIM_DUE_SCRIPT`."""
+        keys = [self.DUE_KEY, self.DATA_KEY]
+        # {index: its position in keys, counting from 1 like Lua}
+        positions = {}
+        args = []
+
+        for id_ in ids:
+            indexes = []
+
+            for index in self._indexes(id_):
+                if index not in positions:
+                    keys.append(index)
+                    positions[index] = len(keys)
+
+                indexes.append(str(positions[index]))
+
+            args += (id_, ",".join(indexes))
+
+        return keys, args
+
+    def _add(self, tr, id_, due, kwargs):
+        tr.zadd(self.DUE_KEY, due, id_)
+        tr.hset(self.DATA_KEY, id_, json.dumps(kwargs))
+
+        for index in self._indexes(id_):
+            tr.zadd(index, due, id_)
 
     async def create_timer(self, name_, time_, **kwargs):
-        h = self._gen_hash(kwargs)
-        kwargs["name"] = name_
+        ret = await self.create_timers([(name_, time_, kwargs)])
+
+        LOG.info("Created timer %s with args %s, waiting %d seconds", name_, kwargs, int(time_))
+        return ret
+
+    async def create_timers(self, timers):
+        """Create several timers in one transaction.
+
+        ``timers`` is an iterable of ``(name, seconds, kwargs)`` tuples."""
+        now = time.time()
+        due_pairs = []
+        data = {}
+        indexes = defaultdict(list)
+
+        for name, time_, kwargs in timers:
+            id_ = self._make_id(name, self._gen_hash(kwargs), kwargs)
+            due = now + time_
+
+            due_pairs += (due, id_)
+            data[id_] = json.dumps({**kwargs, "name": name})
+            for index in self._indexes(id_):
+                indexes[index] += (due, id_)
+
+        if not data:
+            return []
 
         tr = self.bot.redis.multi_exec()
 
-        tr.hmset_dict(f"timer-{name_}:{h}", **kwargs)
-        tr.hmset_dict(f"lookup-timer-{name_}:{h}", **kwargs)
-        tr.expire(f"timer-{name_}:{h}", int(time_))
+        tr.zadd(self.DUE_KEY, *due_pairs)
+        tr.hmset_dict(self.DATA_KEY, data)
+        for index, pairs in indexes.items():
+            tr.zadd(index, *pairs)
 
-        try:
-            ret = await tr.execute()
-        except aioredis.MultiExecError:
-            raise
-        else:
-            LOG.info("Created timers with args %s, waiting %d seconds. SHA256: %s", kwargs, int(time_), h)
-            return ret
+        ret = await tr.execute()
+
+        for due, id_ in zip(due_pairs[::2], due_pairs[1::2]):
+            if due <= self._refill_at + self.horizon:
+                self._schedule(id_, due)
+
+        LOG.debug("Created %s timers", len(data))
+        return ret
 
     async def delete_timer(self, name_, **kwargs):
-        h = self._gen_hash(kwargs)
+        ret = await self.delete_timers([(name_, kwargs)])
 
-        tr = self.bot.redis.multi_exec()
+        LOG.info("Deleted timer %s with args %s", name_, kwargs)
+        return ret
+
+    async def delete_timers(self, timers):
+        """Delete several timers in one transaction.
+
+        ``timers`` is an iterable of ``(name, kwargs)`` tuples."""
+        ids = []
+        indexes = defaultdict(list)
+
+        for name, kwargs in timers:
+            id_ = self._make_id(name, self._gen_hash(kwargs), kwargs)
 
-        tr.delete(f"timer-{name_}:{h}")
-        tr.delete(f"lookup-timer-{name_}:{h}")
+            ids.append(id_)
+            for index in self._indexes(id_):
+                indexes[index].append(id_)
 
-        LOG.info("Deleted timers with args %s. SHA256: %s", kwargs, h)
+            self._scheduled.pop(id_, None)
 
+        if not ids:
+            return []
+
+        tr = self.bot.redis.multi_exec()
+
+        tr.zrem(self.DUE_KEY, *ids)
+        tr.hdel(self.DATA_KEY, *ids)
+        for index, members in indexes.items():
+            tr.zrem(index, *members)
+
+        LOG.debug("Deleted %s timers", len(ids))
         return await tr.execute()
 
+    async def list_timers(self, name, guild_id=None):
+        """Get ``(kwargs, seconds remaining)`` of every pending ``name`` timer, only the ones of ``guild_id`` if passed.
+
+        Soonest first."""
+        index = self.INDEX_PREFIX + name
+        if guild_id is not None:
+            index += f":{guild_id}"
+
+        listed = await self.bot.redis.eval(LIST_SCRIPT, keys=[index, self.DATA_KEY])
+        now = time.time()
+        ret = []
+
+        for data, due in zip(listed[::2], listed[1::2]):
+            kwargs = json.loads(data)
+            del kwargs["name"]
+            ret.append((kwargs, max(float(due) - now, 0)))
+
+        return ret
+
+    def stats(self):
+        return {"scheduled": len(self._scheduled), "queued": self.queue.qsize(), "workers": len(self._workers)}
+
     def _gen_hash(self, kwargs):
         return hashlib.sha256(":".join(f"{key}={value}" for key, value in kwargs.items()).encode()).hexdigest()
 
     def close(self):
-        self.fetch_timers.cancel()
+        self.dispatch_timers.cancel()
+
+        for worker in self._workers:
+            worker.cancel()
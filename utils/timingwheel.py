@@ -0,0 +1,94 @@
+import math
+from functools import reduce
+from operator import mul
+
+
+class TimingWheel:
+    """A hierarchical timing wheel, adding, removing and expiring a key are O(1).
+
+    Level 0 has ``sizes[0]`` slots of ``tick`` seconds, every next level has ``sizes[n]`` slots
+    as long as a whole rotation of the previous one. Keys are cascaded down a level when their slot comes up,
+    the ones due after the last level's rotation wait in an overflow bucket that's checked once per top level slot.
+
+    Times are UNIX timestamps, :meth:`advance` returns the keys due by then."""
+    __slots__ = ("tick", "sizes", "spans", "levels", "overflow", "ready", "_where", "_ticks")
+
+    def __init__(self, *, tick=1.0, sizes=(60, 60, 24), now):
+        self.tick = tick
+        self.sizes = tuple(sizes)
+        # ticks covered by one slot of each level, and by a whole rotation of the last one
+        self.spans = [reduce(mul, self.sizes[:level], 1) for level in range(len(self.sizes) + 1)]
+
+        # [[{key: due tick}]]
+        self.levels = [[{} for _ in range(size)] for size in self.sizes]
+        self.overflow = {}
+        # keys that were already due when added or cascaded
+        self.ready = {}
+
+        # {key: the dict it's in}
+        self._where = {}
+        self._ticks = int(now // tick)
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, key):
+        return key in self._where
+
+    def add(self, key, when):
+        """Schedule ``key`` at ``when``, replacing its previous schedule."""
+        self.remove(key)
+        self._place(key, math.ceil(when / self.tick))
+
+    def remove(self, key):
+        bucket = self._where.pop(key, None)
+        if bucket is not None:
+            del bucket[key]
+
+    def _place(self, key, due):
+        delta = due - self._ticks
+
+        if delta <= 0:
+            bucket = self.ready
+        else:
+            for level, size in enumerate(self.sizes):
+                if delta < self.spans[level + 1]:
+                    bucket = self.levels[level][(due // self.spans[level]) % size]
+                    break
+            else:
+                bucket = self.overflow
+
+        bucket[key] = due
+        self._where[key] = bucket
+
+    def _cascade(self, bucket):
+        items = list(bucket.items())
+        bucket.clear()
+
+        for key, due in items:
+            self._place(key, due)
+
+    def advance(self, now):
+        """Move the wheel to ``now``, returning the keys that are due."""
+        target = int(now // self.tick)
+        top = len(self.sizes) - 1
+
+        while self._ticks < target:
+            self._ticks += 1
+
+            if self._ticks % self.spans[top] == 0:
+                self._cascade(self.overflow)
+
+            for level in range(top, 0, -1):
+                span = self.spans[level]
+                if self._ticks % span == 0:
+                    self._cascade(self.levels[level][(self._ticks // span) % self.sizes[level]])
+
+            self._cascade(self.levels[0][self._ticks % self.sizes[0]])
+
+        due = list(self.ready)
+        for key in due:
+            del self._where[key]
+        self.ready.clear()
+
+        return due
@@ -53,7 +53,8 @@ class Track(wavelink.Track):
             return
 
         data = await self.ctx.get("https://www.googleapis.com/youtube/v3/videos",
-                                  key=key, part="snippet,statistics", id=self.ytid, cache=True)
+                                  key=key, part="snippet,statistics", id=self.ytid, cache=True,
+                                  priority="background")
 
         try:
             self._metadata = track = data["items"][0]